@@ -5,6 +5,8 @@ import sys
 import threading
 import time
 import os
+from src.prediction import PlayerPredictor
+from src.snapshot import SnapshotReceiver
 
 # Enable this for more verbose WebSocket logging
 # websocket.enableTrace(False)
@@ -12,7 +14,7 @@ import os
 class MinimalAirHockeyClient:
     def __init__(self):
         print("Initializing client...")
-        self.server_url = "ws://localhost:8080"
+        self.server_url = "ws://localhost:8080/?delta=1"
         self.connected = False
         self.game_state = None
         self.running = True
@@ -20,6 +22,13 @@ class MinimalAirHockeyClient:
         # Store the last message for debugging
         self.last_message = None
 
+        # Which player we control, and the local prediction of our own mallet
+        self.player_key = None
+        self.predictor = None
+        # token from the welcome message, presented again to take our seat back after a drop
+        self.session = None
+        self.snapshots = SnapshotReceiver()
+
         # Lock for thread-safe access to game state
         self.state_lock = threading.Lock()
 
@@ -65,10 +74,34 @@ class MinimalAirHockeyClient:
                     # Store message for debugging
                     self.last_message = message
 
-                    # Parse message with thread safety
+                    # Parse message with thread safety; deltas are applied to the baseline they name
                     parsed = json.loads(message)
                     with self.state_lock:
-                        self.game_state = parsed
+                        if parsed.get("type") == "welcome":
+                            self.player_key = parsed["player"]
+                            self.session = parsed.get("session", self.session)
+                            if parsed.get("resumed"):
+                                # the server sends a fresh keyframe next, older baselines are gone
+                                self.snapshots = SnapshotReceiver()
+                            return
+                        if parsed.get("type") in ("keyframe", "delta"):
+                            state = self.snapshots.receive(parsed)
+                            if state is None:
+                                return
+                            self.game_state = state
+                        else:
+                            self.game_state = parsed
+
+                        # Reconcile our predicted mallet with the authoritative state
+                        if self.player_key and self.game_state:
+                            if self.predictor is None:
+                                self.predictor = PlayerPredictor.from_state(self.game_state, self.player_key)
+                            acked = self.game_state.get("input_seq", {}).get(self.player_key)
+                            self.predictor.reconcile(self.game_state[self.player_key]["position"], acked)
+
+                    # Acknowledge the snapshot so the server can use it as the next delta baseline
+                    if "seq" in parsed:
+                        ws.send(json.dumps({"ack": parsed["seq"]}))
                 except Exception as e:
                     print(f"Error in on_message: {e}")
 
@@ -79,17 +112,24 @@ class MinimalAirHockeyClient:
                 print(f"WebSocket closed: {close_status_code} - {close_msg}")
                 self.connected = False
 
-            # Create and connect WebSocket
-            self.ws = websocket.WebSocketApp(
-                self.server_url,
-                on_open=on_open,
-                on_message=on_message,
-                on_error=on_error,
-                on_close=on_close
-            )
-
-            # Start WebSocket connection (blocking call)
-            self.ws.run_forever()
+            # Create and connect WebSocket, reconnecting into the same seat while the session is held
+            while self.running:
+                url = self.server_url
+                if self.session:
+                    url += f"&session={self.session}"
+                self.ws = websocket.WebSocketApp(
+                    url,
+                    on_open=on_open,
+                    on_message=on_message,
+                    on_error=on_error,
+                    on_close=on_close
+                )
+
+                # Start WebSocket connection (blocking call)
+                self.ws.run_forever()
+                if not self.running or not self.session:
+                    break
+                time.sleep(1)
 
         except Exception as e:
             print(f"WebSocket connection error: {e}")
@@ -101,7 +141,15 @@ class MinimalAirHockeyClient:
             return
 
         try:
-            message = json.dumps({"dx": dx, "dy": dy})
+            # Predict the move locally and tag it so the server can acknowledge it
+            # and stamp it with the server tick we are looking at, so late hits can be checked against it
+            message = {"dx": dx, "dy": dy}
+            with self.state_lock:
+                if self.predictor is not None:
+                    message["seq"] = self.predictor.apply_input([dx, dy])
+                if self.game_state and "tick" in self.game_state:
+                    message["tick"] = self.game_state["tick"]
+            message = json.dumps(message)
             self.ws.send(message)
         except Exception as e:
             print(f"Error sending movement: {e}")
@@ -186,8 +234,11 @@ class MinimalAirHockeyClient:
             game_state = None
             with self.state_lock:
                 if self.game_state:
-                    # Make a shallow copy to avoid thread issues
-                    game_state = dict(self.game_state)
+                    # Copy to avoid thread issues and to keep the snapshot history untouched
+                    game_state = json.loads(json.dumps(self.game_state))
+                    # Draw our own mallet where we predict it, not where the last snapshot put it
+                    if self.predictor is not None and self.player_key in game_state:
+                        game_state[self.player_key]["position"] = self.predictor.get_position()
 
             if not game_state:
                 # Show waiting screen
@@ -303,8 +354,7 @@ class MinimalAirHockeyClient:
 
             print("Game terminated.")
 
-# Run the game
-if __name__ == "__main__":
+def main():
     print(f"Starting Air Hockey client. Python version: {sys.version}")
     print(f"PyGame version: {pygame.version.ver}")
     print(f"OS: {os.name}")
@@ -315,4 +365,8 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"Fatal error: {e}")
         import traceback
-        traceback.print_exc()
\ No newline at end of file
+        traceback.print_exc()
+
+# Run the game
+if __name__ == "__main__":
+    main()
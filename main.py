@@ -0,0 +1,29 @@
+import importlib
+import sys
+
+# command -> module with a main(); a module is only imported when its command runs, so `simulate` never
+# loads the transport and only `client` needs pygame
+COMMANDS = {
+    "server": "src.server",
+    "shard": "src.sharding",
+    "simulate": "src.simulation",
+    "bench": "src.benchmark",
+    "load": "src.loadgen",
+    "results": "src.results",
+    "client": "client_test_alpha",
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        print(f"usage: main.py {{{','.join(COMMANDS)}}} [options]", file=sys.stderr)
+        return 0 if argv and argv[0] in ("-h", "--help") else 2
+    command = argv[0]
+    # each command parses sys.argv itself, so its --help shows the subcommand name
+    sys.argv = [f"main.py {command}"] + argv[1:]
+    return importlib.import_module(COMMANDS[command]).main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import importlib
+
+# Names resolve on first use, so `import src.game_engine` (or this package) loads no networking, database
+# or NumPy code; simulation workers only pay for the modules they touch.
+_EXPORTS = {
+    "Game": "game_engine",
+    "Player": "game_engine",
+    "Ball": "game_engine",
+    "BatchGame": "batch_engine",
+    "BotController": "bots",
+    "MatchRecorder": "replay",
+    "MatchReplay": "replay",
+    "ResultsStore": "results",
+    "Room": "rooms",
+    "RoomRegistry": "rooms",
+    "Network": "network",
+    "Server": "server",
+    "Supervisor": "sharding",
+    "run_simulation": "simulation",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,114 @@
+import numpy as np
+from .game_engine import Game
+
+WALL_MARGIN = 10
+HIT_DISTANCE = 10
+
+
+class BatchGame:
+    # player arrays are indexed [match, player], vector arrays end in (x, y)
+    def __init__(self, games):
+        if any(len(g.players) != 2 or len(g.balls) != 1 for g in games):
+            raise ValueError("BatchGame only runs 1v1 single-puck games.")
+        if any(g.continuous_collision for g in games):
+            raise ValueError("BatchGame only runs the discrete collision model.")
+        count = len(games)
+        self.count = count
+        self.screen_width = np.array([g.screen_width for g in games], dtype=np.float64)
+        self.screen_height = np.array([g.screen_height for g in games], dtype=np.float64)
+
+        players = [(g.player1, g.player2) for g in games]
+        self.player_position = np.array([[[p.x, p.y] for p in pair] for pair in players], dtype=np.float64)
+        self.player_speed = np.array([[[p.x_speed, p.y_speed] for p in pair] for pair in players], dtype=np.float64)
+        self.player_direction = np.array([[p.directions for p in pair] for pair in players], dtype=np.float64)
+        self.player_radius = np.array([[p.radius for p in pair] for pair in players], dtype=np.float64)
+        # left, right, top, bottom
+        self.player_bounds = np.array([[[p.left_x, p.right_x, p.top_y, p.bottom_y] for p in pair]
+                                       for pair in players], dtype=np.float64)
+        self.player_score = np.array([[p.score for p in pair] for pair in players], dtype=np.int64)
+        self.goals_to_win = np.array([g.goals_to_win for g in games], dtype=np.int64)
+
+        self.ball_position = np.array([[g.ball.x, g.ball.y] for g in games], dtype=np.float64)
+        self.ball_speed = np.array([g.ball.speed for g in games], dtype=np.float64)
+        self.ball_direction = np.array([g.ball.direction for g in games], dtype=np.float64)
+        self.ball_radius = np.array([g.ball.radius for g in games], dtype=np.float64)
+        self.ball_initial_speed = np.array([g.ball.initial_speed for g in games], dtype=np.float64)
+        self.ball_friction = np.array([g.ball.friction for g in games], dtype=np.float64)
+
+        self.games = games
+
+    @classmethod
+    def create(cls, count):
+        return cls([Game() for _ in range(count)])
+
+    def players_update(self, moves):
+        moves = np.asarray(moves, dtype=np.float64).reshape(self.count, 2, 2)
+        self.player_direction[:] = moves
+        step = moves * self.player_speed
+        position = self.player_position + step
+
+        x, y = position[..., 0], position[..., 1]
+        radius = self.player_radius
+        bounds = self.player_bounds
+        blocked_x = (x + radius > bounds[..., 1] - WALL_MARGIN) | (x - radius < bounds[..., 0])
+        blocked_y = (y + radius > bounds[..., 3] - WALL_MARGIN) | (y - radius < bounds[..., 2])
+        position[..., 0] -= step[..., 0] * blocked_x
+        position[..., 1] -= step[..., 1] * blocked_y
+        self.player_position = position
+
+    def ball_updates(self):
+        self.ball_speed *= self.ball_friction[:, None]
+
+        for player in range(2):
+            delta = self.ball_position - self.player_position[:, player]
+            # np.power matches the scalar engine's ``** 0.5`` bit for bit, np.sqrt may not
+            distance = np.power(delta[:, 0] ** 2 + delta[:, 1] ** 2, 0.5)
+            hit = np.abs(distance - self.player_radius[:, player] - self.ball_radius) < HIT_DISTANCE
+            self.ball_direction[hit] = self.player_direction[hit, player]
+            self.ball_speed[hit] = self.ball_initial_speed[hit]
+
+        x, y = self.ball_position[:, 0], self.ball_position[:, 1]
+        radius = self.ball_radius
+        flip_x = (x + radius > self.screen_width - WALL_MARGIN) | (x - radius < 0)
+        flip_y = (y + radius > self.screen_height - WALL_MARGIN) | (y - radius < 0)
+        self.ball_direction[flip_x, 0] *= -1
+        self.ball_direction[flip_y, 1] *= -1
+
+        self.ball_position += self.ball_speed * self.ball_direction
+
+    def check_goals(self):
+        x, y = self.ball_position[:, 0], self.ball_position[:, 1]
+        radius = self.ball_radius
+        in_mouth = np.abs(x - self.screen_width / 2) <= Game.GOAL_WIDTH / 2
+        top = in_mouth & (y - radius <= 0)
+        bottom = in_mouth & ~top & (y + radius >= self.screen_height - WALL_MARGIN)
+        # a puck in the top goal scores for player2 and the other way round, then restarts in the conceding half
+        self.player_score[top, 1] += 1
+        self.player_score[bottom, 0] += 1
+        scored = top | bottom
+        self.ball_position[scored, 0] = self.screen_width[scored] // 2
+        self.ball_position[top, 1] = self.screen_height[top] // 4
+        self.ball_position[bottom, 1] = 3 * self.screen_height[bottom] // 4
+        self.ball_speed[scored] = 0
+        won = scored & (self.goals_to_win > 0) & (self.player_score.max(axis=1) >= self.goals_to_win)
+        self.player_score[won] = 0
+
+    def game_step(self, moves):
+        self.players_update(moves)
+        self.ball_updates()
+        self.check_goals()
+
+    def write_back(self):
+        for index, game in enumerate(self.games):
+            for player, p in enumerate((game.player1, game.player2)):
+                p.x, p.y = self.player_position[index, player].tolist()
+                p.directions = self.player_direction[index, player].tolist()
+                p.score = int(self.player_score[index, player])
+            game.ball.x, game.ball.y = self.ball_position[index].tolist()
+            game.ball.speed = self.ball_speed[index].tolist()
+            game.ball.direction = self.ball_direction[index].tolist()
+        return self.games
+
+    def get_updates(self, index):
+        self.write_back()
+        return self.games[index].get_updates()
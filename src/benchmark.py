@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import copy
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from .codec import BinaryCodec
+from .game_engine import Game
+from .network import Network
+from .rooms import Room, RoomRegistry
+from .server import Server
+from .snapshot import SnapshotHistory
+from .transport import connect
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def random_moves(count, seed=0):
+    rng = random.Random(seed)
+    return [{"player1": [rng.choice((-1, 0, 1)), rng.choice((-1, 0, 1))],
+             "player2": [rng.choice((-1, 0, 1)), rng.choice((-1, 0, 1))]} for _ in range(count)]
+
+
+def bench_engine_step(ticks):
+    game = Game()
+    moves = random_moves(1000)
+    started = time.perf_counter()
+    for tick in range(ticks):
+        game.game_step(moves[tick % 1000])
+    elapsed = time.perf_counter() - started
+    return {"ticks_per_second": {"value": ticks / elapsed, "higher_is_better": True}}
+
+
+def bench_serialization(frames):
+    game = Game()
+    moves = random_moves(1000)
+    states = []
+    for tick in range(frames):
+        game.game_step(moves[tick % 1000])
+        states.append(copy.deepcopy(game.get_updates()))
+
+    game = Game()
+    started = time.perf_counter()
+    for tick in range(frames):
+        json.dumps(game.get_updates())
+    json_time = (time.perf_counter() - started) / frames
+
+    codec = BinaryCodec()
+    started = time.perf_counter()
+    for seq, state in enumerate(states):
+        codec.encode_state(state, seq)
+    binary_time = (time.perf_counter() - started) / frames
+
+    history = SnapshotHistory()
+
+    class Receiver:
+        acked_seq = None
+        keyframe_seq = None
+
+    receiver = Receiver()
+    delta_bytes = 0
+    started = time.perf_counter()
+    for state in states:
+        # the client acks every frame, and its ack for the previous one arrives before the next broadcast
+        if history.seq:
+            history.ack(receiver, history.seq)
+        history.push(state)
+        delta_bytes += len(history.message_for(receiver))
+    delta_time = (time.perf_counter() - started) / frames
+
+    return {
+        "json_us_per_frame": {"value": json_time * 1e6, "higher_is_better": False},
+        "binary_us_per_frame": {"value": binary_time * 1e6, "higher_is_better": False},
+        "delta_us_per_frame": {"value": delta_time * 1e6, "higher_is_better": False},
+        "json_bytes_per_frame": {"value": len(json.dumps(states[-1])), "higher_is_better": False},
+        "delta_bytes_per_frame": {"value": delta_bytes / frames, "higher_is_better": False},
+    }
+
+
+async def read_frames(connection, count):
+    received = 0
+    while received < count:
+        if await connection.recv() is None:
+            break
+        received += 1
+    return received
+
+
+async def disconnect(network, connections):
+    # let the server run its client_left handlers before the loop shuts down
+    for connection in connections:
+        connection.close()
+    deadline = time.perf_counter() + 5
+    while network.client_options and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    await network.server.stop()
+
+
+async def bench_broadcast(clients, frames, options=""):
+    rooms = RoomRegistry()
+    network = Network(rooms, host="127.0.0.1", port=0)
+    # one room holding every client, so a single send_to_room call covers the whole fan-out
+    room = rooms.rooms["bench"] = Room("bench", max_players=clients)
+    await network.start_server()
+    connections = [await connect("127.0.0.1", network.server.port, f"/?room=bench{options}")
+                   for _ in range(clients)]
+    while room.clientService.get_count() < clients:
+        await asyncio.sleep(0.01)
+    readers = [asyncio.create_task(read_frames(c, frames)) for c in connections]
+
+    send_times = []
+    started = time.perf_counter()
+    for _ in range(frames):
+        room.step()
+        frame_started = time.perf_counter()
+        network.send_to_room(room, room.get_updates())
+        send_times.append(time.perf_counter() - frame_started)
+        await asyncio.sleep(0)
+    # frames shed by the per-client queues never arrive, so stop waiting once the stragglers go quiet
+    await asyncio.wait(readers, timeout=5)
+    elapsed = time.perf_counter() - started
+    delivered = sum(reader.result() if reader.done() else 0 for reader in readers)
+    for reader in readers:
+        reader.cancel()
+
+    await disconnect(network, connections)
+    return {
+        "clients": {"value": clients, "higher_is_better": None},
+        "send_to_room_us": {"value": statistics.fmean(send_times) * 1e6, "higher_is_better": False},
+        "delivered_frames_per_second": {"value": delivered / elapsed, "higher_is_better": True},
+    }
+
+
+async def bench_tick_latency(seconds, rooms_count):
+    server = Server(host="127.0.0.1", port=0, metrics_port=None)
+    durations = []
+    step_rooms, broadcast_rooms = server.step_rooms, server.broadcast_rooms
+
+    def timed_step():
+        started = time.perf_counter()
+        step_rooms()
+        durations.append(time.perf_counter() - started)
+
+    def timed_broadcast():
+        started = time.perf_counter()
+        broadcast_rooms()
+        durations[-1] += time.perf_counter() - started
+
+    server.step_rooms, server.broadcast_rooms = timed_step, timed_broadcast
+    await server.network.start_server()
+    port = server.network.server.port
+    connections = []
+    for index in range(rooms_count):
+        for _ in range(2):
+            connections.append(await connect("127.0.0.1", port, f"/?room=bench{index}"))
+    while len(server.rooms.active_rooms()) < rooms_count:
+        await asyncio.sleep(0.01)
+    readers = [asyncio.create_task(read_frames(c, 10 ** 9)) for c in connections]
+
+    loop = asyncio.create_task(server.game_loop())
+    await asyncio.sleep(seconds)
+    server.scheduler.stop()
+    await loop
+    for reader in readers:
+        reader.cancel()
+    await disconnect(server.network, connections)
+
+    stats = server.scheduler.stats.get_info()
+    return {
+        "rooms": {"value": rooms_count, "higher_is_better": None},
+        "tick_p50_ms": {"value": percentile(durations, .5) * 1000, "higher_is_better": False},
+        "tick_p99_ms": {"value": percentile(durations, .99) * 1000, "higher_is_better": False},
+        "jitter_ms": {"value": stats["jitter_ms"], "higher_is_better": False},
+        "overruns": {"value": stats["overruns"], "higher_is_better": False},
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, metrics in results["benchmarks"].items():
+        for metric, result in metrics.items():
+            previous = baseline.get("benchmarks", {}).get(name, {}).get(metric)
+            if previous is None or result["higher_is_better"] is None or not previous["value"]:
+                continue
+            change = (result["value"] - previous["value"]) / previous["value"]
+            if (change < -tolerance) if result["higher_is_better"] else (change > tolerance):
+                regressions.append(f"{name}.{metric}: {previous['value']:.4g} -> {result['value']:.4g} "
+                                   f"({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark engine step, serialization and broadcast throughput.")
+    parser.add_argument("--only", nargs="*", choices=["engine", "serialization", "broadcast", "tick"])
+    parser.add_argument("--ticks", type=int, default=200000)
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against a results file from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=.1, help="allowed relative regression")
+    args = parser.parse_args()
+    selected = set(args.only or ["engine", "serialization", "broadcast", "tick"])
+
+    benchmarks = {}
+    if "engine" in selected:
+        benchmarks["engine_step"] = bench_engine_step(args.ticks)
+    if "serialization" in selected:
+        benchmarks["serialization"] = bench_serialization(args.frames)
+    if "broadcast" in selected:
+        benchmarks["broadcast"] = asyncio.run(bench_broadcast(args.clients, max(1, args.frames // 20)))
+    if "tick" in selected:
+        benchmarks["tick_latency"] = asyncio.run(bench_tick_latency(args.seconds, args.rooms))
+
+    results = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "time": time.time()},
+        "benchmarks": benchmarks,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import collections
+import random
+import time
+
+# reaction_ticks: how often the bot picks a new target; horizon: how many ticks of ball flight it plans
+# ahead; plan_steps: ball steps it may simulate per tick; aim_error: pixels of noise on every target
+DIFFICULTIES = {
+    "easy": {"reaction_ticks": 15, "horizon": 30, "plan_steps": 8, "aim_error": 40},
+    "medium": {"reaction_ticks": 6, "horizon": 60, "plan_steps": 16, "aim_error": 15},
+    "hard": {"reaction_ticks": 2, "horizon": 90, "plan_steps": 32, "aim_error": 0},
+}
+
+
+def sign(value):
+    return (value > 0) - (value < 0)
+
+
+class BallPlanner:
+    # Predicted ball positions for the coming ticks, walls and friction only. Every tick the prediction for
+    # "now" is checked against the real ball: while they agree the plan is kept and only extended, a mallet
+    # hit invalidates it and planning restarts from the ball's current state.
+    def __init__(self, horizon=60, tolerance=1e-6):
+        self.horizon = horizon
+        self.tolerance = tolerance
+        self.path = collections.deque()
+        self.state = None
+        self.replans = 0
+
+    def sync(self, ball):
+        if self.path:
+            x, y = self.path.popleft()
+            if abs(x - ball.x) <= self.tolerance and abs(y - ball.y) <= self.tolerance:
+                return
+        self.path.clear()
+        self.state = [ball.x, ball.y, ball.speed[0], ball.speed[1], ball.direction[0], ball.direction[1]]
+        self.replans += 1
+
+    def extend(self, ball, bounds, max_steps, deadline):
+        # mirrors Ball.update_speed_time, check_accident_with_wall and move
+        left_x, right_x, top_y, bottom_y = bounds
+        radius, friction = ball.radius, ball.friction
+        x, y, speed_x, speed_y, direction_x, direction_y = self.state
+        steps = 0
+        while len(self.path) < self.horizon and steps < max_steps:
+            speed_x *= friction
+            speed_y *= friction
+            if x + radius > right_x - 10 or x - radius < left_x:
+                direction_x *= -1
+            if y + radius > bottom_y - 10 or y - radius < top_y:
+                direction_y *= -1
+            x, y = x + speed_x * direction_x, y + speed_y * direction_y
+            self.path.append((x, y))
+            steps += 1
+            if steps % 8 == 0 and time.perf_counter() > deadline:
+                break
+        self.state[:] = x, y, speed_x, speed_y, direction_x, direction_y
+        return steps
+
+
+class BotController:
+    # Drives one seat through the same moves_info path as a human's input. Work per tick is bounded by
+    # plan_steps and budget seconds; the planner carries its prediction over between ticks.
+    def __init__(self, seat, difficulty="medium", budget=0.0002, seed=None):
+        if difficulty not in DIFFICULTIES:
+            raise ValueError(f"Unknown bot difficulty: {difficulty}")
+        settings = DIFFICULTIES[difficulty]
+        self.seat = seat
+        self.difficulty = difficulty
+        self.budget = budget
+        self.reaction_ticks = settings["reaction_ticks"]
+        self.plan_steps = settings["plan_steps"]
+        self.aim_error = settings["aim_error"]
+        self.planner = BallPlanner(settings["horizon"])
+        self.rng = random.Random(seed)
+        self.move = [0, 0]
+        self.target_x = None
+        self.target_y = None
+        self.ticks = 0
+
+    def __call__(self, game):
+        deadline = time.perf_counter() + self.budget
+        player, ball = game.seats[self.seat], game.ball
+        self.planner.sync(ball)
+        self.planner.extend(ball, (0, game.screen_width, 0, game.screen_height), self.plan_steps, deadline)
+        if self.target_x is None or self.ticks % self.reaction_ticks == 0:
+            self.choose_target(player, ball, deadline)
+        self.ticks += 1
+
+        forward = 1 if player.top_y == 0 else -1
+        # the engine only registers a hit while the centres are within 10px of touching
+        inner, reach = player.radius + ball.radius - 10, player.radius + ball.radius + 10
+        dx, dy = ball.x - player.x, ball.y - player.y
+        distance = dx * dx + dy * dy
+        if distance <= inner * inner:
+            # too deep to count as a hit; backing straight off would land in the hit band and drag the ball
+            # along behind the mallet, so leave the way that stays clear of it
+            self.release(game, player, ball, dx, dy, inner, reach, forward)
+            return self.move
+        if distance < reach * reach:
+            # close enough to strike: a hit gives the ball the mallet's direction, so push towards the opponent
+            # unless the ball is behind us, then knock it off our back wall
+            move_x = sign(dx) if abs(dx) >= player.x_speed else 0
+            move_y = forward if dy * forward > 0 else sign(dy)
+            # driving the ball into a wall only pins it there. A mallet stopped at the edge of its half still
+            # hands the ball its direction, which is what sends the ball on without the mallet.
+            if self.into_wall(game, ball, move_x, 0):
+                move_x = 0
+            if self.into_wall(game, ball, 0, move_y):
+                move_y = 0
+            carried = (ball.speed == ball.initial_speed and ball.direction[0] == player.directions[0]
+                       and ball.direction[1] == player.directions[1])
+            if carried or move_x == move_y == 0:
+                # the ball moves exactly like the mallet that hit it, so following through would hit it again
+                # every tick and carry it along; step out of reach instead and come at it again
+                self.release(game, player, ball, dx, dy, inner, reach, forward)
+            else:
+                self.move[0], self.move[1] = move_x, move_y
+            return self.move
+        dx, dy = self.target_x - player.x, self.target_y - player.y
+        self.move[0] = sign(dx) if abs(dx) >= player.x_speed else 0
+        self.move[1] = sign(dy) if abs(dy) >= player.y_speed else 0
+        return self.move
+
+    def release(self, game, player, ball, dx, dy, inner, reach, forward):
+        # Any move that leaves the centres within the hit band hits the ball again. Take the one that clears
+        # the band by most; when none does, a hit keeps the ball where it is relative to the mallet until the
+        # mallet stops at the edge of its half, so make it one that carries the ball away from the walls,
+        # forward if possible
+        best = None
+        for move_x in (-1, 0, 1):
+            for move_y in (-1, 0, 1):
+                step_x = move_x * player.x_speed if self.can_move(player, move_x, 0) else 0
+                step_y = move_y * player.y_speed if self.can_move(player, 0, move_y) else 0
+                distance = ((dx - step_x) ** 2 + (dy - step_y) ** 2) ** 0.5
+                clearance = max(distance - reach, inner - distance)
+                useful = (move_x or move_y) and not self.into_wall(game, ball, move_x, move_y)
+                score = (clearance > 0, clearance if clearance > 0 else 0, bool(useful), move_y * forward)
+                if best is None or score > best:
+                    best = score
+                    self.move[0], self.move[1] = move_x, move_y
+
+    @staticmethod
+    def can_move(player, move_x, move_y):
+        # Player.move takes a step back on any axis that leaves the mallet's half
+        x, y = player.x + move_x * player.x_speed, player.y + move_y * player.y_speed
+        if move_x and (x + player.radius > player.right_x - 10 or x - player.radius < player.left_x):
+            return False
+        if move_y and (y + player.radius > player.bottom_y - 10 or y - player.radius < player.top_y):
+            return False
+        return True
+
+    @staticmethod
+    def into_wall(game, ball, move_x, move_y):
+        # same margins as Ball.check_accident_with_wall, which runs after the hit and turns the ball around on
+        # any axis where it is already inside the margin
+        def against_x(x):
+            return x + ball.radius > game.screen_width - 10 or x - ball.radius < 0
+
+        def against_y(y):
+            return y + ball.radius > game.screen_height - 10 or y - ball.radius < 0
+
+        if against_x(ball.x):
+            move_x = -move_x
+        if against_y(ball.y):
+            move_y = -move_y
+        x, y = ball.x + move_x * ball.initial_speed[0], ball.y + move_y * ball.initial_speed[1]
+        return bool(move_x and against_x(x) or move_y and against_y(y))
+
+    def choose_target(self, player, ball, deadline):
+        # mallet centres the engine lets this player reach, see Player.move
+        left, right = player.left_x + player.radius, player.right_x - 10 - player.radius
+        top, bottom = player.top_y + player.radius, player.bottom_y - 10 - player.radius
+        forward = 1 if player.top_y == 0 else -1
+        reach = player.radius + ball.radius
+        target = None
+        for tick, (x, y) in enumerate(self.planner.path, 1):
+            if tick % 16 == 0 and time.perf_counter() > deadline:
+                if self.target_x is not None:
+                    # out of time: keep the current target until the next reaction tick
+                    return
+                break
+            # line up just behind the ball, on our own goal's side of it, or meet it head on when it is
+            # already between us and our wall
+            target_x = min(max(x, left), right)
+            target_y = min(max(y - forward * reach, top), bottom)
+            if abs(target_x - x) + abs(target_y - y) > reach + 10:
+                target_y = min(max(y + forward * (reach + 5), top), bottom)
+                if abs(target_x - x) + abs(target_y - y) > reach + 10:
+                    continue
+            if max(abs(target_x - player.x) / player.x_speed, abs(target_y - player.y) / player.y_speed) <= tick:
+                target = target_x, target_y
+                break
+        if target is None:
+            if max(ball.speed) < 1 and top - reach <= ball.y <= bottom + reach:
+                # the ball has come to rest on our side, walk over to it however long it takes
+                target = min(max(ball.x, left), right), min(max(ball.y - forward * reach, top), bottom)
+            else:
+                # nothing reachable in the planned flight (or no time to look): guard the middle of our own
+                # back quarter
+                target = (left + right) / 2, top + (bottom - top) * (.25 if forward > 0 else .75)
+        self.target_x, self.target_y = target
+        if self.aim_error:
+            self.target_x += self.rng.uniform(-self.aim_error, self.aim_error)
@@ -0,0 +1,74 @@
+import logging
+from .codec import get_codec
+
+logger = logging.getLogger(__name__)
+
+
+class Client:
+    def __init__(self, client, index, delta=False, codec='json'):
+        self.client = client
+        self.index = index
+        self.delta = delta
+        self.codec = get_codec(codec)
+        self.acked_seq = None
+        self.keyframe_seq = None
+        # False while the seat is held for a dropped player
+        self.connected = True
+
+
+class Session:
+    # A seat a player can take back by presenting the token, either while connected (a new connection
+    # takes over from a half-open one) or within the grace window after a drop
+    def __init__(self, token, room, client):
+        self.token = token
+        self.room = room
+        self.client = client
+        self.expires = None
+
+
+class ClientsService:
+    def __init__(self):
+        self.clients = []
+
+    def add_client(self, client, options=None):
+        options = options or {}
+        taken = {c.index for c in self.clients}
+        index = 0
+        while index in taken:
+            index += 1
+        self.clients.append(Client(client, index, delta=options.get('delta', False),
+                                   codec=options.get('codec', 'json')))
+        logger.debug("Client %s seated as player %d", client['id'], index + 1)
+
+    def get_count(self):
+        return len(self.clients)
+
+    def replace_client(self, client, new_client, options=None):
+        # a reconnecting player keeps the seat index; the new connection starts from a fresh keyframe
+        options = options or {}
+        c = self.get_client(client)
+        if c is None:
+            return None
+        c.client = new_client
+        c.delta = options.get('delta', False)
+        c.codec = get_codec(options.get('codec', 'json'))
+        c.acked_seq = None
+        c.keyframe_seq = None
+        c.connected = True
+        return c
+
+    def remove_client(self, client):
+        self.clients = [c for c in self.clients if c.client != client]
+
+    def get_client(self, client):
+        for c in self.clients:
+            if c.client == client:
+                return c
+        return None
+
+    def get_index(self, client):
+        c = self.get_client(client)
+        return c.index if c is not None else None
+
+    def get_clients(self):
+        return self.clients
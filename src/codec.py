@@ -0,0 +1,119 @@
+import json
+import struct
+
+STATE_FRAME = 1
+STATE_FORMAT = struct.Struct("<BIffffffHHII")
+INPUT_FORMAT = struct.Struct("<bb")
+SEQUENCED_INPUT_FORMAT = struct.Struct("<bbI")
+# also carries the header seq of the last state frame the client rendered, for lag compensation
+STAMPED_INPUT_FORMAT = struct.Struct("<bbII")
+
+
+def normalize_move(dx, dy):
+    # an input is a direction on each axis: plain numbers count by their sign, anything else drops the input
+    move = []
+    for value in (dx, dy):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        move.append((value > 0) - (value < 0))
+    return move
+
+
+def counter(value):
+    # seq and tick fields are plain integers, anything else counts as missing
+    return value if isinstance(value, int) and not isinstance(value, bool) else None
+
+
+class JsonCodec:
+    name = "json"
+
+    def encode_state(self, updates, seq):
+        return json.dumps(updates)
+
+    def decode_input(self, message):
+        # the server parses every message once to look for room and ack fields and passes the object on
+        moves = json.loads(message) if isinstance(message, (str, bytes)) else message
+        if not isinstance(moves, dict):
+            raise ValueError("Input messages must be JSON objects.")
+        move = normalize_move(moves.get("dx", 0), moves.get("dy", 0))
+        if move is None:
+            raise ValueError("dx and dy must be numbers.")
+        return move, counter(moves.get("seq"))
+
+    def decode_stamp(self, message):
+        # JSON inputs are stamped with the tick of the last update the client saw
+        moves = json.loads(message) if isinstance(message, (str, bytes)) else message
+        return counter(moves.get("tick")) if isinstance(moves, dict) else None
+
+    def encode_input(self, dx, dy, seq=None, tick=None):
+        message = {"dx": dx, "dy": dy}
+        if seq is not None:
+            message["seq"] = seq
+        if tick is not None:
+            message["tick"] = tick
+        return json.dumps(message)
+
+
+class BinaryCodec:
+    name = "binary"
+
+    def encode_state(self, updates, seq):
+        ball = updates["ball"]["position"]
+        player1 = updates["player1"]
+        player2 = updates["player2"]
+        input_seq = updates.get("input_seq", {})
+        return STATE_FORMAT.pack(
+            STATE_FRAME, seq & 0xFFFFFFFF,
+            ball[0], ball[1],
+            player1["position"][0], player1["position"][1],
+            player2["position"][0], player2["position"][1],
+            player1["score"], player2["score"],
+            input_seq.get("player1", 0) & 0xFFFFFFFF, input_seq.get("player2", 0) & 0xFFFFFFFF,
+        )
+
+    def decode_state(self, frame):
+        (frame_type, seq, ball_x, ball_y, player1_x, player1_y, player2_x, player2_y,
+         player1_score, player2_score, player1_input_seq, player2_input_seq) = STATE_FORMAT.unpack(frame)
+        if frame_type != STATE_FRAME:
+            raise ValueError(f"Unknown frame type {frame_type}.")
+        return {
+            "seq": seq,
+            "ball": {"position": [ball_x, ball_y]},
+            "player1": {"position": [player1_x, player1_y], "score": player1_score},
+            "player2": {"position": [player2_x, player2_y], "score": player2_score},
+            "input_seq": {"player1": player1_input_seq, "player2": player2_input_seq},
+        }
+
+    def decode_input(self, message):
+        if len(message) == INPUT_FORMAT.size:
+            dx, dy = INPUT_FORMAT.unpack(message)
+            return normalize_move(dx, dy), None
+        if len(message) == SEQUENCED_INPUT_FORMAT.size:
+            dx, dy, seq = SEQUENCED_INPUT_FORMAT.unpack(message)
+            return normalize_move(dx, dy), seq
+        if len(message) == STAMPED_INPUT_FORMAT.size:
+            dx, dy, seq, _ = STAMPED_INPUT_FORMAT.unpack(message)
+            return normalize_move(dx, dy), seq
+        raise ValueError("Input packets must be 2 bytes, 6 with a sequence number or 10 with a state stamp.")
+
+    def decode_stamp(self, message):
+        if len(message) != STAMPED_INPUT_FORMAT.size:
+            return None
+        return STAMPED_INPUT_FORMAT.unpack(message)[3]
+
+    def encode_input(self, dx, dy, seq=None, seen_seq=None):
+        if seq is None:
+            return INPUT_FORMAT.pack(dx, dy)
+        if seen_seq is None:
+            return SEQUENCED_INPUT_FORMAT.pack(dx, dy, seq & 0xFFFFFFFF)
+        return STAMPED_INPUT_FORMAT.pack(dx, dy, seq & 0xFFFFFFFF, seen_seq & 0xFFFFFFFF)
+
+
+CODECS = {
+    JsonCodec.name: JsonCodec(),
+    BinaryCodec.name: BinaryCodec(),
+}
+
+
+def get_codec(name):
+    return CODECS.get(name, CODECS[JsonCodec.name])
@@ -1,3 +1,7 @@
+import copy
+import math
+
+
 def multiply_elements(*args):
     if len(args) == 2:
         if isinstance(args[0], list) and isinstance(args[1], list):
@@ -16,7 +20,26 @@ def multiply_elements(*args):
         raise ValueError("Exactly two arguments are required.")
 
 
+def time_of_impact(px, py, wx, wy, distance):
+    # earliest t >= 0 with |p + w * t| == distance, None unless the circles are approaching
+    c = px * px + py * py - distance * distance
+    b = px * wx + py * wy
+    if c <= 0:
+        return 0.0 if b < 0 else None
+    a = wx * wx + wy * wy
+    if b >= 0 or a == 0:
+        return None
+    discriminant = b * b - a * c
+    if discriminant < 0:
+        return None
+    return (-b - math.sqrt(discriminant)) / a
+
+
 class Player:
+    STATE_FIELDS = ("x", "y", "previous_x", "previous_y", "directions", "score", "name", "x_speed", "y_speed",
+                    "color", "radius", "left_x", "right_x", "top_y", "bottom_y")
+    __slots__ = STATE_FIELDS + ("info",)
+
     def __init__(self, color, x_coordinate, y_coordinate, score, radius=15, name="computer", speed=None):
         if speed is None:
             speed = [1, 1]
@@ -33,9 +56,15 @@ class Player:
         self.top_y = None
         self.bottom_y = None
         self.directions = [0, 0]
+        self.previous_x = self.x
+        self.previous_y = self.y
+        self.info = {"player_name": name, "score": score, "color": color, "radius": radius,
+                     "position": [self.x, self.y], "speed": [self.x_speed, self.y_speed]}
 
     def move(self, direction):
-        self.directions = direction.copy()
+        self.previous_x, self.previous_y = self.x, self.y
+        self.directions[0] = direction[0]
+        self.directions[1] = direction[1]
         self.x, self.y = self.x + direction[0] * self.x_speed, self.y + direction[1] * self.y_speed
         self.x -= direction[0] * self.x_speed * (
                     self.x + self.radius > self.right_x - 10 or self.x - self.radius < self.left_x)
@@ -43,14 +72,23 @@ class Player:
                     self.y + self.radius > self.bottom_y - 10 or self.y - self.radius < self.top_y)
 
     def get_info(self):
-        return {
-            "player_name": self.name,
-            "score": self.score,
-            "color": self.color,
-            "radius": self.radius,
-            "position": [self.x, self.y],
-            "speed": [self.x_speed, self.y_speed]
-        }
+        # refreshed in place and shared between calls, copy it to keep a tick's values around
+        info = self.info
+        info["player_name"] = self.name
+        info["score"] = self.score
+        info["color"] = self.color
+        info["radius"] = self.radius
+        position, speed = info["position"], info["speed"]
+        position[0], position[1] = self.x, self.y
+        speed[0], speed[1] = self.x_speed, self.y_speed
+        return info
+
+    def get_state(self):
+        return {field: copy.copy(getattr(self, field)) for field in self.STATE_FIELDS}
+
+    def load_state(self, state):
+        for field in self.STATE_FIELDS:
+            setattr(self, field, copy.copy(state[field]))
 
     def update_boundries(self, left_x, right_x, top_y, bottom_y):
         self.left_x = left_x
@@ -70,20 +108,28 @@ class Player:
 
 
 class Ball:
-    def __init__(self, x_coordinate, y_coordinate, speed: list, radius, direction=None, color="white"):
+    STATE_FIELDS = ("x", "y", "speed", "radius", "color", "direction", "friction", "initial_speed")
+    __slots__ = STATE_FIELDS + ("info",)
+
+    def __init__(self, x_coordinate, y_coordinate, speed: list, radius, direction=None, color="white",
+                 friction=.99, initial_speed=None):
         if direction is None:
             direction = [1, 1]
+        if initial_speed is None:
+            initial_speed = [7, 7]
         self.x = x_coordinate
         self.y = y_coordinate
         self.speed = speed
         self.radius = radius
         self.color = color
         self.direction = direction
-        self.initial_speed = [7, 7]
+        self.friction = friction
+        self.initial_speed = initial_speed
+        self.info = {"position": [self.x, self.y], "speed": list(speed), "radius": radius, "color": color}
 
     def update_speed_time(self):
-        self.speed[0] *= .99
-        self.speed[1] *= .99
+        self.speed[0] *= self.friction
+        self.speed[1] *= self.friction
 
     def check_accident_with_wall(self, left_x, right_x, top_y, bottom_y):
         if self.x + self.radius > right_x - 10 or self.x - self.radius < left_x:
@@ -95,26 +141,164 @@ class Ball:
     def check_accident_with_player(self, player: Player):
         distance = ((self.x - player.x) ** 2 + (self.y - player.y) ** 2) ** 0.5
         if abs(distance - player.radius - self.radius) < 10:
-            self.direction = player.directions.copy()
-            self.speed = self.initial_speed.copy()
+            self.hit_by(player)
+
+    def hit_by(self, player: Player):
+        self.direction[0], self.direction[1] = player.directions
+        self.speed[0], self.speed[1] = self.initial_speed
+
+    def check_if_goal(self, left_x, right_x, top_y, bottom_y, goal_width):
+        # 0 when the puck is in the top goal, 1 for the bottom one; the mouths sit in the middle of each end
+        # wall, which keeps the same 10px margin as check_accident_with_wall
+        if abs(self.x - (left_x + right_x) / 2) > goal_width / 2:
+            return None
+        if self.y - self.radius <= top_y:
+            return 0
+        if self.y + self.radius >= bottom_y - 10:
+            return 1
+        return None
+
+    def get_state(self):
+        return {field: copy.copy(getattr(self, field)) for field in self.STATE_FIELDS}
+
+    def load_state(self, state):
+        for field in self.STATE_FIELDS:
+            setattr(self, field, copy.copy(state[field]))
+
+    def get_velocity(self):
+        return self.speed[0] * self.direction[0], self.speed[1] * self.direction[1]
+
+    def set_velocity(self, vx, vy):
+        self.speed[0], self.speed[1] = abs(vx), abs(vy)
+        self.direction[0], self.direction[1] = -1 if vx < 0 else 1, -1 if vy < 0 else 1
+
+    def sweep(self, players, left_x, right_x, top_y, bottom_y, max_collisions=4, goal_width=0):
+        # walls keep the same 10px margin on the right and bottom as check_accident_with_wall
+        min_x, max_x = left_x + self.radius, right_x - 10 - self.radius
+        min_y, max_y = top_y + self.radius, bottom_y - 10 - self.radius
+        vx, vy = self.get_velocity()
+        elapsed = 0.0
+        for _ in range(max_collisions):
+            remaining = 1.0 - elapsed
+            hit_time, hit = remaining, None
+
+            if vx > 0 and self.x + vx * hit_time > max_x:
+                hit_time, hit = max(0.0, (max_x - self.x) / vx), "x"
+            elif vx < 0 and self.x + vx * hit_time < min_x:
+                hit_time, hit = max(0.0, (min_x - self.x) / vx), "x"
+            if vy > 0 and self.y + vy * hit_time > max_y:
+                hit_time, hit = max(0.0, (max_y - self.y) / vy), "y"
+            elif vy < 0 and self.y + vy * hit_time < min_y:
+                hit_time, hit = max(0.0, (min_y - self.y) / vy), "y"
+
+            for player in players:
+                # mallet moves linearly from its previous position over the tick
+                ux, uy = player.x - player.previous_x, player.y - player.previous_y
+                px = self.x - (player.previous_x + ux * elapsed)
+                py = self.y - (player.previous_y + uy * elapsed)
+                toi = time_of_impact(px, py, vx - ux, vy - uy, self.radius + player.radius)
+                if toi is not None and toi <= hit_time:
+                    hit_time, hit = toi, player
+
+            self.x += vx * hit_time
+            self.y += vy * hit_time
+            elapsed += hit_time
+            if hit is None:
+                break
+            if hit == "x":
+                vx = -vx
+            elif hit == "y":
+                if goal_width and abs(self.x - (left_x + right_x) / 2) <= goal_width / 2:
+                    # reached the goal line inside the mouth: stop on it so check_if_goal counts it
+                    self.y = min_y if vy < 0 else max_y
+                    break
+                vy = -vy
+            else:
+                vx, vy = self.reflect_from(hit, vx, vy, elapsed)
+
+        self.x = min(max(self.x, min_x), max_x)
+        self.y = min(max(self.y, min_y), max_y)
+        self.set_velocity(vx, vy)
+
+    def reflect_from(self, player, vx, vy, elapsed):
+        ux, uy = player.x - player.previous_x, player.y - player.previous_y
+        mallet_x = player.previous_x + ux * elapsed
+        mallet_y = player.previous_y + uy * elapsed
+        nx, ny = self.x - mallet_x, self.y - mallet_y
+        length = math.hypot(nx, ny)
+        if length == 0:
+            nx, ny, length = 0.0, -1.0, 1.0
+        nx, ny = nx / length, ny / length
 
-    def check_if_goal(self):
-        pass
+        # resolve any overlap the mallet caused by moving into the ball
+        overlap = self.radius + player.radius - length
+        if overlap > 0:
+            self.x += nx * overlap
+            self.y += ny * overlap
+
+        relative = (vx - ux) * nx + (vy - uy) * ny
+        if relative < 0:
+            vx -= 2 * relative * nx
+            vy -= 2 * relative * ny
+        return vx, vy
 
     def move(self):
         self.x, self.y = self.x + self.speed[0] * self.direction[0], self.y + self.speed[1] * self.direction[1]
 
     def get_info(self):
-        return {
-            "position": [self.x, self.y],
-            "speed": self.speed,
-            "radius": self.radius,
-            "color": self.color
-        }
+        info = self.info
+        position, speed = info["position"], info["speed"]
+        position[0], position[1] = self.x, self.y
+        speed[0], speed[1] = self.speed
+        info["radius"] = self.radius
+        info["color"] = self.color
+        return info
+
+
+class SpatialGrid:
+    # Uniform grid broad-phase over mallet centres. Cell lists are kept and cleared between ticks instead of
+    # being rebuilt, and query() fills a caller-owned list with matching body indices in insertion order.
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.used = []
+
+    def rebuild(self, bodies):
+        for key in self.used:
+            self.cells[key].clear()
+        self.used.clear()
+        size = self.cell_size
+        for index, body in enumerate(bodies):
+            key = int(body.x // size) * 4096 + int(body.y // size)
+            cell = self.cells.get(key)
+            if cell is None:
+                cell = self.cells[key] = []
+            if not cell:
+                self.used.append(key)
+            cell.append(index)
+
+    def query(self, x, y, radius, out):
+        out.clear()
+        size = self.cell_size
+        for cell_x in range(int((x - radius) // size), int((x + radius) // size) + 1):
+            for cell_y in range(int((y - radius) // size), int((y + radius) // size) + 1):
+                cell = self.cells.get(cell_x * 4096 + cell_y)
+                if cell:
+                    out.extend(cell)
+        # callers resolve hits in body order, the same order the brute-force loop uses
+        out.sort()
+        return out
 
 
 class Game:
-    def __init__(self, player1: Player = None, player2: Player = None):
+    # with fewer candidate pairs than this, checking every mallet against every puck beats the grid
+    BROAD_PHASE_MIN_PAIRS = 96
+    GOAL_WIDTH = 160
+    # speeds and friction are per tick, tuned at this rate; other tick rates rescale them to the same game
+    REFERENCE_TICK_RATE = 100
+
+    def __init__(self, player1: Player = None, player2: Player = None, continuous_collision=False,
+                 mallets_per_side=1, pucks=1, goals_to_win=0, tick_rate=REFERENCE_TICK_RATE):
         if player1 is None:
             player1 = Player(color="red", x_coordinate=200, y_coordinate=200, score=0, radius=20, name="Player1",
                              speed=[7, 7])
@@ -125,33 +309,165 @@ class Game:
         self.screen_height = 600
         self.player1 = player1
         self.player2 = player2
+        self.mallets_per_side = mallets_per_side
+        self.pucks = pucks
+
+        # odd seats defend the top half and even seats the bottom half, so player1/player2 keep their sides
+        self.players = [player1, player2]
+        for number in range(3, 2 * mallets_per_side + 1):
+            top = number % 2 == 1
+            self.players.append(Player(color="red" if top else "blue",
+                                       x_coordinate=200 + 400 * ((number - 1) // 2) / mallets_per_side,
+                                       y_coordinate=200 if top else 500, score=0, radius=20,
+                                       name=f"Player{number}", speed=[7, 7]))
+        self.seat_names = tuple(f"player{number}" for number in range(1, len(self.players) + 1))
+        self.seats = dict(zip(self.seat_names, self.players))
+        self.seat_players = tuple(self.seats.items())
+        for player in self.players:
+            player.update_boundries(0, self.screen_width, 0, self.screen_height)
 
-        self.player1.update_boundries(0, self.screen_width, 0, self.screen_height)
-        self.player2.update_boundries(0, self.screen_width, 0, self.screen_height)
         self.ball = Ball(self.screen_width // 2, self.screen_height // 2, [0, 0], 10)
+        self.balls = [self.ball]
+        for number in range(1, pucks):
+            offset = 100 * ((number + 1) // 2) * (1 if number % 2 else -1)
+            self.balls.append(Ball(self.screen_width // 2 + offset, self.screen_height // 2, [0, 0], 10))
         self.ball_speed = [1, -1]
+        if tick_rate != self.REFERENCE_TICK_RATE:
+            self.scale_to_tick_rate(tick_rate)
+        self.continuous_collision = continuous_collision
+        self.grid = SpatialGrid()
+        self.candidates = []
+        self.use_grid = len(self.players) * len(self.balls) >= self.BROAD_PHASE_MIN_PAIRS
+        self.updates = {}
+        self.ball_infos = [ball.get_info() for ball in self.balls]
+        # 0 plays on forever, otherwise the scores reset once a side gets there
+        self.goals_to_win = goals_to_win
+        # (ball index, scoring side) for each goal of the last step, side 0 being the odd seats at the top
+        self.goals = []
+        # (top score, bottom score) on the step a side reached goals_to_win, before the reset
+        self.final_scores = None
+
+    def scale_to_tick_rate(self, tick_rate):
+        # same pixels per second and the same speed lost per second at any rate
+        scale = self.REFERENCE_TICK_RATE / tick_rate
+        for player in self.players:
+            player.x_speed *= scale
+            player.y_speed *= scale
+        for ball in self.balls:
+            ball.speed[0] *= scale
+            ball.speed[1] *= scale
+            ball.initial_speed = [speed * scale for speed in ball.initial_speed]
+            ball.friction **= scale
 
     def players_update(self, move_info):
-        self.player1.move(move_info["player1"])
-        self.player2.move(move_info["player2"])
+        for seat, player in self.seat_players:
+            player.move(move_info[seat])
 
     def ball_updates(self):
-        self.ball.update_speed_time()
-        self.ball.check_accident_with_player(self.player1)
-        self.ball.check_accident_with_player(self.player2)
-        self.ball.check_accident_with_wall(0, self.screen_width, 0, self.screen_height)
-        self.ball.move()
+        if not self.use_grid:
+            players = self.players
+            for ball in self.balls:
+                ball.update_speed_time()
+                if self.continuous_collision:
+                    ball.sweep(players, 0, self.screen_width, 0, self.screen_height, goal_width=self.GOAL_WIDTH)
+                    continue
+                for player in players:
+                    ball.check_accident_with_player(player)
+                ball.check_accident_with_wall(0, self.screen_width, 0, self.screen_height)
+                ball.move()
+            return
+
+        players = self.players
+        self.grid.rebuild(players)
+        max_radius = max(player.radius for player in players)
+        max_travel = max(player.x_speed + player.y_speed for player in players)
+        for ball in self.balls:
+            ball.update_speed_time()
+            # the discrete check hits within 10px of touching, a sweep also reaches one tick of travel further
+            reach = ball.radius + max_radius + 10
+            if self.continuous_collision:
+                reach += ball.speed[0] + ball.speed[1] + 2 * max_travel
+            nearby = self.grid.query(ball.x, ball.y, reach, self.candidates)
+            if self.continuous_collision:
+                ball.sweep([players[index] for index in nearby], 0, self.screen_width, 0, self.screen_height,
+                           goal_width=self.GOAL_WIDTH)
+                continue
+            for index in nearby:
+                ball.check_accident_with_player(players[index])
+            ball.check_accident_with_wall(0, self.screen_width, 0, self.screen_height)
+            ball.move()
 
     def game_step(self, move_info):
         self.players_update(move_info)
         self.ball_updates()
+        self.check_goals()
         return self.get_updates()
 
-    def get_updates(self):
+    def check_goals(self):
+        self.goals.clear()
+        self.final_scores = None
+        for index, ball in enumerate(self.balls):
+            conceded = ball.check_if_goal(0, self.screen_width, 0, self.screen_height, self.GOAL_WIDTH)
+            if conceded is None:
+                continue
+            scored = 1 - conceded
+            # every mallet on a side carries the side's score
+            for player in self.players[scored::2]:
+                player.score += 1
+            self.goals.append((index, scored))
+            # face-off: the puck restarts at rest in the middle of the conceding half
+            ball.x = self.screen_width // 2
+            ball.y = self.screen_height // 4 if conceded == 0 else 3 * self.screen_height // 4
+            ball.speed[0] = ball.speed[1] = 0
+        if self.goals and self.goals_to_win and max(self.player1.score, self.player2.score) >= self.goals_to_win:
+            self.final_scores = (self.player1.score, self.player2.score)
+            for player in self.players:
+                player.score = 0
+
+    def get_state(self):
         return {
-            "player1": self.player1.get_info(),
-            "player2": self.player2.get_info(),
-            "ball": self.ball.get_info(),
-            "game_screen_width": self.screen_width,
-            "game_screen_height": self.screen_height,
+            "screen_width": self.screen_width,
+            "screen_height": self.screen_height,
+            "continuous_collision": self.continuous_collision,
+            "mallets_per_side": self.mallets_per_side,
+            "pucks": self.pucks,
+            "goals_to_win": self.goals_to_win,
+            "player1": self.player1.get_state(),
+            "player2": self.player2.get_state(),
+            "ball": self.ball.get_state(),
+            "extra_players": [player.get_state() for player in self.players[2:]],
+            "extra_balls": [ball.get_state() for ball in self.balls[1:]],
         }
+
+    def load_state(self, state):
+        self.screen_width = state["screen_width"]
+        self.screen_height = state["screen_height"]
+        self.continuous_collision = state["continuous_collision"]
+        self.goals_to_win = state.get("goals_to_win", 0)
+        self.player1.load_state(state["player1"])
+        self.player2.load_state(state["player2"])
+        self.ball.load_state(state["ball"])
+        for player, player_state in zip(self.players[2:], state.get("extra_players", ())):
+            player.load_state(player_state)
+        for ball, ball_state in zip(self.balls[1:], state.get("extra_balls", ())):
+            ball.load_state(ball_state)
+
+    @classmethod
+    def from_state(cls, state):
+        game = cls(mallets_per_side=state.get("mallets_per_side", 1), pucks=state.get("pucks", 1))
+        game.load_state(state)
+        return game
+
+    def get_updates(self):
+        # one buffer per game, rewritten every call: snapshots freeze it and codecs encode it straight away
+        updates = self.updates
+        for seat, player in self.seat_players:
+            updates[seat] = player.get_info()
+        updates["ball"] = self.ball.get_info()
+        if len(self.balls) > 1:
+            for ball in self.balls:
+                ball.get_info()
+            updates["balls"] = self.ball_infos
+        updates["game_screen_width"] = self.screen_width
+        updates["game_screen_height"] = self.screen_height
+        return updates
@@ -0,0 +1,52 @@
+class InputBuffer:
+    # Per-player ring of inputs keyed by the tick they are applied on. Every input gets its own tick, so
+    # messages arriving between ticks are queued instead of overwritten; once max_backlog ticks are queued
+    # the newest input replaces the last queued one. Ticks without input repeat the last unsequenced move
+    # for up to hold_ticks (clients sending slower than the tick rate), sequenced inputs are applied once.
+    def __init__(self, size=8, max_backlog=4, hold_ticks=3):
+        if max_backlog >= size:
+            raise ValueError("max_backlog must be smaller than the ring size.")
+        self.size = size
+        self.max_backlog = max_backlog
+        self.hold_ticks = hold_ticks
+        self.ticks = [-1] * size
+        self.moves = [[0, 0] for _ in range(size)]
+        self.seqs = [None] * size
+        self.stamps = [None] * size
+        self.next_tick = 0
+        self.current_tick = 0
+        self.last_move = [0, 0]
+        self.last_seq = None
+        self.held_ticks = hold_ticks
+        self.coalesced = 0
+
+    def push(self, move, seq=None, stamp=None):
+        tick = max(self.next_tick, self.current_tick)
+        if tick - self.current_tick >= self.max_backlog:
+            tick = self.next_tick - 1
+            self.coalesced += 1
+        slot = tick % self.size
+        self.ticks[slot] = tick
+        self.moves[slot][0] = move[0]
+        self.moves[slot][1] = move[1]
+        self.seqs[slot] = seq
+        self.stamps[slot] = stamp
+        self.next_tick = tick + 1
+
+    def pop(self, tick):
+        self.current_tick = tick + 1
+        slot = tick % self.size
+        if self.ticks[slot] == tick:
+            self.ticks[slot] = -1
+            self.last_move[0], self.last_move[1] = self.moves[slot]
+            self.last_seq = self.seqs[slot]
+            self.held_ticks = 0
+            return self.last_move, self.last_seq, self.stamps[slot]
+        if self.last_seq is None and self.held_ticks < self.hold_ticks:
+            self.held_ticks += 1
+            return self.last_move, None, None
+        self.last_move[0] = self.last_move[1] = 0
+        return self.last_move, None, None
+
+    def get_depth(self):
+        return max(0, self.next_tick - self.current_tick)
@@ -0,0 +1,349 @@
+import argparse
+import array
+import asyncio
+import json
+import multiprocessing
+import random
+import socket
+import time
+from .benchmark import percentile
+from .codec import BinaryCodec, get_codec
+from .snapshot import SnapshotReceiver
+from .transport import connect
+
+
+def sign(value):
+    return (value > 0) - (value < 0)
+
+
+def summarize(values, scale=1000):
+    if not values:
+        return None
+    return {
+        "p50": percentile(values, .5) * scale,
+        "p90": percentile(values, .9) * scale,
+        "p99": percentile(values, .99) * scale,
+        "max": max(values) * scale,
+    }
+
+
+class InputPattern:
+    # Roughly how people play: hold a direction for a few hundred ms, rest now and then, chase the puck
+    def __init__(self, rng):
+        self.rng = rng
+        self.move = (0, 0)
+        self.until = 0.0
+
+    def __call__(self, now, state, seat):
+        if now < self.until:
+            return self.move
+        rng = self.rng
+        roll = rng.random()
+        if roll < .2:
+            self.move, duration = (0, 0), rng.uniform(.2, 1.0)
+        elif roll < .6 and state is not None and seat in state:
+            ball, player = state["ball"]["position"], state[seat]["position"]
+            self.move, duration = (sign(ball[0] - player[0]), sign(ball[1] - player[1])), rng.uniform(.1, .3)
+        else:
+            self.move, duration = (rng.choice((-1, 0, 1)), rng.choice((-1, 0, 1))), rng.uniform(.15, .6)
+        self.until = now + duration
+        return self.move
+
+
+class RoleStats:
+    # float samples live in arrays of doubles, a few thousand connections at 60 frames a second add up
+    def __init__(self):
+        self.opened = 0
+        self.failed = 0
+        self.closed_early = 0
+        self.frames = 0
+        self.bytes = 0
+        self.intervals = array.array('d')
+        self.latencies = array.array('d')
+        self.inputs_sent = 0
+
+    def merge(self, other):
+        self.opened += other.opened
+        self.failed += other.failed
+        self.closed_early += other.closed_early
+        self.frames += other.frames
+        self.bytes += other.bytes
+        self.intervals.extend(other.intervals)
+        self.latencies.extend(other.latencies)
+        self.inputs_sent += other.inputs_sent
+        return self
+
+    def summary(self, seconds):
+        typical = percentile(self.intervals, .5) if self.intervals else 0.0
+        # jitter: how far each gap between frames strays from the typical gap
+        jitter = array.array('d', (abs(interval - typical) for interval in self.intervals))
+        return {
+            "connections": {"opened": self.opened, "failed": self.failed, "closed_early": self.closed_early},
+            "frames_per_second": self.frames / seconds if seconds else None,
+            "bytes_per_second": self.bytes / seconds if seconds else None,
+            "interval_ms": summarize(self.intervals),
+            "jitter_ms": summarize(jitter),
+            "inputs_sent": self.inputs_sent,
+            "inputs_echoed": len(self.latencies),
+            "echo_latency_ms": summarize(self.latencies),
+        }
+
+
+class LoadClient:
+    def __init__(self, host, port, room, stats, role="player", codec="json", delta=False, input_rate=30,
+                 spectator_rate=20, seed=None):
+        self.host = host
+        self.port = port
+        self.room = room
+        self.stats = stats
+        self.role = role
+        self.codec = get_codec(codec)
+        self.delta = delta
+        self.input_rate = input_rate
+        self.spectator_rate = spectator_rate
+        self.pattern = InputPattern(random.Random(seed))
+        self.receiver = SnapshotReceiver()
+        self.connection = None
+        self.seat = None
+        self.state = None
+        self.state_seq = None
+        # inputs waiting for the server to report them processed, oldest first
+        self.pending = []
+        self.seq = 0
+        self.measure_from = 0.0
+
+    def path(self):
+        path = f"/?room={self.room}&codec={self.codec.name}"
+        if self.role == "spectator":
+            return path + f"&role=spectator&rate={self.spectator_rate}"
+        # session=new only asks for the welcome message, which names our seat
+        return path + "&session=new" + ("&delta=1" if self.delta else "")
+
+    async def open(self):
+        self.connection = await connect(self.host, self.port, self.path())
+        self.stats.opened += 1
+
+    async def read(self):
+        stats = self.stats
+        last = None
+        while True:
+            message = await self.connection.recv()
+            if message is None:
+                return
+            now = time.perf_counter()
+            if isinstance(message, bytes):
+                state = self.codec.decode_state(message)
+                seq = state["seq"]
+            else:
+                data = json.loads(message)
+                kind = data.get("type")
+                if kind == "welcome":
+                    self.seat = data.get("player")
+                    continue
+                if kind in ("keyframe", "delta"):
+                    state = self.receiver.receive(data)
+                    if state is None:
+                        continue
+                    if self.delta:
+                        self.connection.send(json.dumps({"ack": data["seq"]}))
+                else:
+                    state = data
+                seq = data.get("seq")
+            self.state, self.state_seq = state, seq
+            if now < self.measure_from:
+                last = None
+                continue
+            stats.frames += 1
+            stats.bytes += len(message)
+            if last is not None:
+                stats.intervals.append(now - last)
+            last = now
+            if self.seat is not None and self.pending:
+                acked = state.get("input_seq", {}).get(self.seat, 0)
+                done = 0
+                for seq, sent in self.pending:
+                    if seq > acked:
+                        break
+                    stats.latencies.append(now - sent)
+                    done += 1
+                del self.pending[:done]
+
+    async def write(self):
+        interval = 1 / self.input_rate
+        binary = isinstance(self.codec, BinaryCodec)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            dx, dy = self.pattern(now, self.state, self.seat)
+            self.seq += 1
+            if binary:
+                self.connection.send(self.codec.encode_input(dx, dy, self.seq, self.state_seq))
+            else:
+                tick = self.state.get("tick") if self.state is not None else None
+                self.connection.send(self.codec.encode_input(dx, dy, self.seq, tick))
+            if now >= self.measure_from:
+                self.stats.inputs_sent += 1
+                self.pending.append((self.seq, now))
+                if len(self.pending) > 1024:
+                    # the server stopped echoing, e.g. the room is waiting for its other players
+                    del self.pending[:512]
+
+    async def run(self):
+        tasks = [asyncio.ensure_future(self.read())]
+        if self.role == "player":
+            tasks.append(asyncio.ensure_future(self.write()))
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            # reaching here before being cancelled means the server hung up or sent garbage
+            self.stats.closed_early += 1
+            for task in done:
+                task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.connection.close()
+
+
+class LoadGenerator:
+    # With shards > 1 each process runs every shards-th connection; rooms are numbered from the global
+    # connection index, so the same room's players may come from different processes
+    def __init__(self, host="127.0.0.1", port=8080, players=100, spectators=0, players_per_room=2, codec="json",
+                 delta=False, input_rate=30, spectator_rate=20, ramp=2.0, warmup=1.0, max_connecting=200, seed=0,
+                 room_prefix="load", shard=0, shards=1):
+        self.players_stats = RoleStats()
+        self.spectators_stats = RoleStats()
+        self.ramp = ramp
+        self.warmup = warmup
+        self.max_connecting = max_connecting
+        rooms = max(1, (players + players_per_room - 1) // players_per_room)
+        self.clients = [LoadClient(host, port, f"{room_prefix}-{index // players_per_room}", self.players_stats,
+                                   "player", codec, delta, input_rate, spectator_rate, seed + index)
+                        for index in range(shard, players, shards)]
+        self.clients += [LoadClient(host, port, f"{room_prefix}-{index % rooms}", self.spectators_stats,
+                                    "spectator", codec, delta, input_rate, spectator_rate, seed + players + index)
+                         for index in range(shard, spectators, shards)]
+
+    async def start_client(self, client, delay, connecting):
+        await asyncio.sleep(delay)
+        async with connecting:
+            try:
+                await client.open()
+            except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                client.stats.failed += 1
+                return
+        await client.run()
+
+    async def run(self, seconds):
+        connecting = asyncio.Semaphore(self.max_connecting)
+        spacing = self.ramp / max(1, len(self.clients))
+        # nothing is measured until every connection had its chance to open and settle
+        measure_from = time.perf_counter() + self.ramp + self.warmup
+        for client in self.clients:
+            client.measure_from = measure_from
+        tasks = [asyncio.ensure_future(self.start_client(client, index * spacing, connecting))
+                 for index, client in enumerate(self.clients)]
+        await asyncio.sleep(max(0.0, measure_from - time.perf_counter()) + seconds)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return self.players_stats, self.spectators_stats
+
+
+def run_shard(options, seconds):
+    raise_file_limit()
+    return asyncio.run(LoadGenerator(**options).run(seconds))
+
+
+def run_load(seconds, processes=1, **options):
+    if processes == 1:
+        players, spectators = run_shard(options, seconds)
+    else:
+        # one event loop decodes a few thousand frames a second, spread bigger runs over processes
+        shards = [(dict(options, shard=index, shards=processes), seconds) for index in range(processes)]
+        with multiprocessing.get_context("spawn").Pool(processes) as pool:
+            results = pool.starmap(run_shard, shards)
+        players, spectators = RoleStats(), RoleStats()
+        for shard_players, shard_spectators in results:
+            players.merge(shard_players)
+            spectators.merge(shard_spectators)
+    return {
+        "players": players.summary(seconds),
+        "spectators": spectators.summary(seconds) if spectators.opened else None,
+    }
+
+
+def run_server(port, server_options):
+    from .server import Server
+    Server(host="127.0.0.1", port=port, metrics_port=None, **server_options).start_server()
+
+
+def start_local_server(port, server_options, timeout=10):
+    # in its own process, so the load generator's event loop does not compete with the server's
+    process = multiprocessing.get_context("spawn").Process(target=run_server, args=(port, server_options),
+                                                            daemon=True)
+    process.start()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(.1)
+    process.kill()
+    raise RuntimeError(f"Local server did not start listening on port {port}.")
+
+
+def raise_file_limit():
+    # every connection is a file descriptor, twice over with a local server
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open many synthetic player and spectator connections to a "
+                                                 "server and report frame jitter and input echo latency.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--serve", action="store_true", help="start a local server on --port in a separate process")
+    parser.add_argument("--players", type=int, default=100)
+    parser.add_argument("--spectators", type=int, default=0)
+    parser.add_argument("--players-per-room", type=int, default=2)
+    parser.add_argument("--codec", choices=["json", "binary"], default="json")
+    parser.add_argument("--delta", action="store_true", help="JSON players ask for keyframes and deltas")
+    parser.add_argument("--input-rate", type=float, default=30, help="inputs per second per player")
+    parser.add_argument("--spectator-rate", type=float, default=20)
+    parser.add_argument("--seconds", type=float, default=10, help="measured time, after ramp-up and warmup")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which connections are opened")
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--processes", type=int, default=1, help="generator processes to spread connections over")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    raise_file_limit()
+    server = None
+    if args.serve:
+        server = start_local_server(args.port, {"mallets_per_side": max(1, args.players_per_room // 2)})
+    try:
+        report = run_load(args.seconds, args.processes, host=args.host, port=args.port, players=args.players,
+                          spectators=args.spectators, players_per_room=args.players_per_room, codec=args.codec,
+                          delta=args.delta, input_rate=args.input_rate, spectator_rate=args.spectator_rate,
+                          ramp=args.ramp, warmup=args.warmup, seed=args.seed)
+    finally:
+        if server is not None:
+            server.kill()
+            server.join()
+    report["settings"] = vars(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
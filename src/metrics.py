@@ -0,0 +1,172 @@
+import asyncio
+import bisect
+import cProfile
+import io
+import logging
+import pstats
+
+logger = logging.getLogger(__name__)
+
+TIME_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1)
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 16384, 65536)
+DEPTH_BUCKETS = (0, 1, 2, 3, 4, 6, 8)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    def __init__(self, name, help_text=""):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def render(self):
+        return [f"{self.name} {self.value}"]
+
+
+class Histogram:
+    # Fixed buckets so observe() is a bisect and two additions, cumulative counts are only built on render
+    def __init__(self, name, buckets, help_text=""):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self):
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {total}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def counter(self, name, help_text=""):
+        if name not in self.counters:
+            self.counters[name] = Counter(name, help_text)
+        return self.counters[name]
+
+    def histogram(self, name, buckets=TIME_BUCKETS, help_text=""):
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(name, buckets, help_text)
+        return self.histograms[name]
+
+    def gauge(self, name, fn, help_text="", label=None, kind="gauge"):
+        # gauges are read when the endpoint is scraped, so they cost nothing on the hot path. With a label,
+        # fn returns a dict of label value -> gauge value; kind="counter" exposes totals kept elsewhere
+        self.gauges[name] = (fn, help_text, label, kind)
+
+    def render(self):
+        lines = []
+        for metric in self.counters.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} counter")
+            lines.extend(metric.render())
+        for metric in self.histograms.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} histogram")
+            lines.extend(metric.render())
+        for name, (fn, help_text, label, kind) in self.gauges.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if label is None:
+                lines.append(f"{name} {fn()}")
+                continue
+            for key, value in fn().items():
+                lines.append(f'{name}{{{label}="{escape_label(key)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    # Runs every sample_every-th call under cProfile; 0 disables it and call() is a plain passthrough
+    def __init__(self, sample_every=0):
+        self.sample_every = sample_every
+        self.calls = 0
+        self.samples = 0
+        self.profile = cProfile.Profile() if sample_every else None
+
+    def call(self, fn, *args):
+        if not self.sample_every:
+            return fn(*args)
+        self.calls += 1
+        if self.calls % self.sample_every:
+            return fn(*args)
+        self.samples += 1
+        self.profile.enable()
+        try:
+            return fn(*args)
+        finally:
+            self.profile.disable()
+
+    def report(self, limit=30):
+        if self.profile is None or not self.samples:
+            return "profiler disabled\n" if self.profile is None else "no samples yet\n"
+        output = io.StringIO()
+        output.write(f"{self.samples} sampled calls\n")
+        pstats.Stats(self.profile, stream=output).sort_stats("cumulative").print_stats(limit)
+        return output.getvalue()
+
+
+class MetricsServer:
+    # Plain-text HTTP endpoint: /metrics for the registry, /profile for the sampling profiler
+    def __init__(self, metrics, profiler=None, host='127.0.0.1', port=9100):
+        self.metrics = metrics
+        self.profiler = profiler
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info("Metrics endpoint listening on http://%s:%s/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+            path = request.split(b" ", 2)[1].decode("latin-1").split("?")[0]
+            if path == "/metrics":
+                status, body = "200 OK", self.metrics.render()
+            elif path == "/profile" and self.profiler is not None:
+                status, body = "200 OK", self.profiler.report()
+            else:
+                status, body = "404 Not Found", "not found\n"
+            payload = body.encode()
+            writer.write((
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode() + payload)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError,
+                IndexError):
+            pass
+        finally:
+            writer.close()
@@ -1,98 +1,281 @@
 import json
-from websocket_server import WebsocketServer
+import logging
+import math
+import secrets
 import time
+from urllib.parse import parse_qs
+from .clients import Session
+from .codec import BinaryCodec, JsonCodec
+from .metrics import SIZE_BUCKETS, Metrics
+from .transport import WebsocketTransport
 
+logger = logging.getLogger(__name__)
 
-class Client:
-    def __init__(self, client, index):
-        self.client = client
-        self.index = index
+DEFAULT_ROOM = "default"
 
-class ClientsService:
-    def __init__(self):
-        self.clients = []
 
-    def add_client(self, client):
-        index = 0
-        if len(self.clients) > 0:
-            index = 1 - self.clients[0].index
-        self.clients.append(Client(client, index))
-        for client in self.clients:
-            print(client.client, client.index)
+class Network:
+    def __init__(self, rooms, host='0.0.0.0', port=8080, metrics=None, owns_room=None, grace_period=10.0):
+        self.server = WebsocketTransport(host=host, port=port)
+        self.rooms = rooms
+        self.client_rooms = {}
+        self.client_options = {}
+        self.json_codec = JsonCodec()
+        self.binary_codec = BinaryCodec()
+        # set on sharded workers, which may only host the rooms routed to them
+        self.owns_room = owns_room
+        # seconds a dropped player's seat is held for them, 0 frees it straight away
+        self.grace_period = grace_period
+        self.sessions = {}
+        self.client_sessions = {}
+        self.suspended = {}
+        self.metrics = metrics or Metrics()
+        self.serialize_time = self.metrics.histogram(
+            'serialization_seconds', help_text="Time spent encoding one room's broadcast")
+        self.client_frame_bytes = self.metrics.histogram(
+            'client_frame_bytes', SIZE_BUCKETS, help_text="Bytes of each frame sent to a player")
+        self.messages_received = self.metrics.counter('messages_received_total', "Websocket messages received")
 
-    def get_count(self):
-        return len(self.clients)
+    def new_client(self, client, server):
+        logger.info("New client connected: %s", client['id'])
+        query = parse_qs(client.get('query', ''))
+        room_id = query.get('room', [DEFAULT_ROOM])[0]
+        self.update_options(client, {key: values[0] for key, values in query.items()})
+        if not self.join_room(client, room_id) and room_id != DEFAULT_ROOM:
+            server.disconnect_client(client)
 
-    def remove_client(self, client):
-        self.clients = [c for c in self.clients if c.client != client]
+    def join_room(self, client, room_id):
+        if self.owns_room is not None and not self.owns_room(room_id):
+            return False
+        options = self.client_options.get(client['id'], {})
+        token = options.pop('session', None)
+        if token and self.resume_session(client, room_id, token, options):
+            return True
+        asked = token is not None
+        self.leave_room(client)
+        room = self.rooms.join(room_id, client, options)
+        if room is None:
+            return False
+        self.client_rooms[client['id']] = room
+        logger.info("Client %s joined room %s", client['id'], room_id)
 
-    def get_index(self, client):
-        for c in self.clients:
-            if c.client == client:
-                return c.index
-        return None
+        player_index = room.clientService.get_index(client)
+        if player_index is None:
+            return True
+        if asked or options.get('delta') or options.get('codec') == 'binary':
+            # tell newer clients which seat is theirs so they can predict their own mallet, and hand out a
+            # session token; only clients that got one can come back, so only their seats are ever held
+            if self.grace_period:
+                self.open_session(client, room)
+            self.send_welcome(client, room, player_index)
+        return True
 
-    def get_clients(self):
-        return self.clients
+    def send_welcome(self, client, room, player_index, resumed=False):
+        c = room.clientService.get_client(client)
+        welcome = {
+            "type": "welcome",
+            "room": room.room_id,
+            "player": f"player{player_index + 1}",
+            # may differ from the codec asked for, see Room.fit_options
+            "codec": c.codec.name if c is not None else "json",
+        }
+        token = self.client_sessions.get(client['id'])
+        if token is not None:
+            welcome["session"] = token
+            welcome["resumed"] = resumed
+        self.server.send_message(client, json.dumps(welcome))
 
+    def open_session(self, client, room):
+        token = secrets.token_urlsafe(16)
+        self.sessions[token] = Session(token, room, client)
+        self.client_sessions[client['id']] = token
+        return token
 
-class Network:
-    def __init__(self, host='0.0.0.0', port=8080):
-        self.server = WebsocketServer(host=host, port=port)
-        self.clientService: ClientsService = ClientsService()
-        self.moves_info = {
-            'player1': [0, 0],
-            'player2': [0, 0],
-        }
+    def close_session(self, client):
+        token = self.client_sessions.pop(client['id'], None)
+        if token is not None:
+            self.sessions.pop(token, None)
 
-        self.game_started = False
+    def resume_session(self, client, room_id, token, options):
+        session = self.sessions.get(token)
+        room = session.room if session is not None else None
+        if room is None or room.room_id != room_id or self.rooms.get(room_id) is not room:
+            return False
+        old = session.client
+        if old['id'] == client['id']:
+            return True
+        if self.client_rooms.get(old['id']) is room:
+            # the old connection has not noticed it is gone yet; the new one takes the seat over
+            del self.client_rooms[old['id']]
+            self.client_sessions.pop(old['id'], None)
+            self.server.disconnect_client(old)
+        self.leave_room(client)
+        c = room.resume_client(old, client, options)
+        if c is None:
+            return False
+        session.client = client
+        session.expires = None
+        self.suspended.pop(token, None)
+        self.client_rooms[client['id']] = room
+        self.client_sessions[client['id']] = token
+        logger.info("Client %s resumed seat %d in room %s", client['id'], c.index + 1, room_id)
 
-    def new_client(self, client, server):
-        if self.clientService.get_count() >= 2:
-            server.disconnect_client(client)
+        self.send_welcome(client, room, c.index, resumed=True)
+        latest = room.snapshots.latest()
+        if latest is not None:
+            # one keyframe of the current state; later frames follow the usual delta path from it
+            if c.delta or c.codec.name == 'binary':
+                self.server.send_message(client, room.snapshots.message_for(c))
+            else:
+                self.server.send_message(client, c.codec.encode_state(latest, room.snapshots.seq))
+        return True
+
+    def expire_sessions(self, now):
+        for token, session in list(self.suspended.items()):
+            if now < session.expires:
+                continue
+            del self.suspended[token]
+            self.sessions.pop(token, None)
+            logger.info("Session for room %s expired, freeing the seat", session.room.room_id)
+            self.rooms.leave(session.room, session.client)
+
+    def leave_room(self, client):
+        self.close_session(client)
+        room = self.client_rooms.pop(client['id'], None)
+        if room is None:
             return
-        self.clientService.add_client(client)
-        if self.clientService.get_count() == 2:
-            self.game_started = True
-        print(f"New client connected: {client['id']}")
+        self.rooms.leave(room, client)
+
+    def update_options(self, client, values):
+        options = self.client_options.setdefault(client['id'], {})
+        if 'delta' in values:
+            options['delta'] = values['delta'] in (True, 1, '1', 'true')
+        if 'codec' in values:
+            options['codec'] = str(values['codec'])
+        if 'role' in values:
+            options['role'] = str(values['role'])
+        if 'rate' in values:
+            # spectator frames per second; anything but a positive finite number falls back to the default
+            try:
+                rate = float(values['rate'])
+            except (TypeError, ValueError):
+                rate = None
+            if rate is not None and math.isfinite(rate) and rate > 0:
+                options['rate'] = rate
+            else:
+                options.pop('rate', None)
+        if 'bot' in values:
+            # "?bot=1" asks for the default opponent, otherwise it names a difficulty
+            options['bot'] = 'medium' if values['bot'] in (True, 1, '1', 'true') else str(values['bot'])
+        if 'session' in values:
+            # a token from an earlier welcome to take a seat back, any other value just asks for one
+            options['session'] = str(values['session'])
+        if 'name' in values:
+            # leaderboard name; "bot:" is reserved for server bots
+            name = str(values['name']).strip()[:32]
+            options['name'] = name if name and not name.startswith('bot:') else None
 
     def client_left(self, client, server):
-        self.clientService.remove_client(client)
-        print(f"Client disconnected: {client['id']}")
+        token = self.client_sessions.get(client['id'])
+        room = self.client_rooms.get(client['id'])
+        if token is not None and room is not None and room.game_started and not client.get('closed_cleanly'):
+            # the connection dropped without a goodbye: hold the seat and pause the match so the player can
+            # come back to it
+            del self.client_sessions[client['id']]
+            del self.client_rooms[client['id']]
+            room.suspend_client(client)
+            session = self.sessions[token]
+            session.expires = time.monotonic() + self.grace_period
+            self.suspended[token] = session
+        else:
+            self.leave_room(client)
+        self.client_options.pop(client['id'], None)
+        logger.info("Client disconnected: %s", client['id'])
 
     def message_received(self, client, server, message):
-        if not self.game_started:
+        self.messages_received.inc()
+        if isinstance(message, bytes):
+            try:
+                move, seq = self.binary_codec.decode_input(message)
+            except ValueError:
+                return
+            self.apply_move(client, move, seq, seen_seq=self.binary_codec.decode_stamp(message))
+            return
+
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return
+        if not isinstance(data, dict):
+            return
+        if 'room' in data:
+            self.update_options(client, data)
+            if not self.join_room(client, str(data['room'])):
+                self.server.disconnect_client(client)
             return
-        print(f"Message from client {client['id']}: {message} at {time.time()}")
 
-        moves = json.loads(message)
-        move = list(moves.values())
-        player_index = self.clientService.get_index(client)
+        room = self.client_rooms.get(client['id'])
+        if room is not None and 'ack' in data:
+            c = room.clientService.get_client(client)
+            if c is not None:
+                room.snapshots.ack(c, data['ack'])
+            return
+        try:
+            move, seq = self.json_codec.decode_input(data)
+        except ValueError:
+            return
+        self.apply_move(client, move, seq, tick=self.json_codec.decode_stamp(data))
 
-        if player_index == 0:
-            self.moves_info['player1'] = move
-        else:
-            self.moves_info['player2'] = move
+    def apply_move(self, client, move, seq=None, tick=None, seen_seq=None):
+        room = self.client_rooms.get(client['id'])
+        if room is None or not room.get_game_status():
+            return
+        if seen_seq is not None:
+            # binary frames carry no tick, resolve the state the client rendered through the snapshot history
+            snapshot = room.snapshots.snapshots.get(seen_seq)
+            tick = snapshot.get('tick') if snapshot is not None else None
+        room.set_move(client, move, seq, tick)
 
-    def send_to_all(self, message):
-        message = json.dumps(message)
-        for c in self.clientService.get_clients():
-            self.server.send_message(c.client, message)
+    def send_to_room(self, room, updates):
+        started = time.perf_counter()
+        seq = room.snapshots.push(updates)
+        encoded = {}
+        frames = {}
+        sends = []
+        for c in room.clientService.get_clients():
+            if not c.connected:
+                continue
+            if c.codec.name == 'binary':
+                # static fields go out once in a json keyframe, binary frames only carry positions and scores
+                use_snapshot = c.keyframe_seq is None
+            else:
+                use_snapshot = c.delta
 
-    def start_server(self):
+            if use_snapshot:
+                message = room.snapshots.message_for(c)
+            else:
+                message = encoded.get(c.codec.name)
+                if message is None:
+                    message = encoded[c.codec.name] = c.codec.encode_state(updates, seq)
+
+            # every client sharing a payload also shares its websocket frame
+            frame = frames.get(id(message))
+            if frame is None:
+                frame = frames[id(message)] = self.server.prepare(message)
+            sends.append((c, frame))
+        self.serialize_time.observe(time.perf_counter() - started)
+
+        for c, frame in sends:
+            self.client_frame_bytes.observe(len(frame))
+            if not self.server.send_frame(c.client, frame):
+                # a dropped frame may have been the keyframe this client's deltas build on
+                c.keyframe_seq = None
+        return seq
+
+    async def start_server(self, listen=True):
         self.server.set_fn_new_client(self.new_client)
         self.server.set_fn_client_left(self.client_left)
         self.server.set_fn_message_received(self.message_received)
 
-        self.server.run_forever()
-
-    def get_moves(self):
-        moves = self.moves_info
-        self.moves_info = {
-            'player1': [0, 0],
-            'player2': [0, 0],
-        }
-        return moves
-
-    def get_game_status(self):
-        return self.game_started
+        if listen:
+            await self.server.start()
@@ -0,0 +1,41 @@
+import collections
+from .game_engine import Player
+
+
+class PlayerPredictor:
+    def __init__(self, player: Player, max_pending=256):
+        self.player = player
+        self.pending = collections.deque(maxlen=max_pending)
+        self.seq = 0
+        self.corrections = 0
+
+    @classmethod
+    def from_state(cls, state, player_key, **kwargs):
+        info = state[player_key]
+        player = Player(info["color"], info["position"][0], info["position"][1], info["score"],
+                        radius=info["radius"], name=info["player_name"], speed=list(info["speed"]))
+        player.update_boundries(0, state["game_screen_width"], 0, state["game_screen_height"])
+        return cls(player, **kwargs)
+
+    def apply_input(self, move):
+        self.seq += 1
+        self.pending.append((self.seq, list(move)))
+        self.player.move(move)
+        return self.seq
+
+    def reconcile(self, position, acked_seq):
+        if acked_seq is None:
+            return
+        while self.pending and self.pending[0][0] <= acked_seq:
+            self.pending.popleft()
+
+        predicted = (self.player.x, self.player.y)
+        # rewind to the authoritative position and replay everything the server hasn't processed yet
+        self.player.x, self.player.y = position
+        for _, move in self.pending:
+            self.player.move(move)
+        if (self.player.x, self.player.y) != predicted:
+            self.corrections += 1
+
+    def get_position(self):
+        return [self.player.x, self.player.y]
@@ -0,0 +1,163 @@
+import bisect
+import json
+import struct
+import zlib
+from .game_engine import Game
+
+RECORDING_VERSION = 1
+EXTENDED_TICK = 0xFF
+EXTENDED_FORMAT = struct.Struct("<4b")
+# anything the game was handed that is not a small integer is kept exactly, as doubles
+FLOAT_TICK = 0xFE
+FLOAT_FORMAT = struct.Struct("<4d")
+PLAYERS = ("player1", "player2")
+
+
+def encode_moves(move_info, seats=PLAYERS):
+    # one entry per pair of seats, so a 1v1 tick stays a single byte and 2v2 takes two
+    data = b""
+    for index in range(0, len(seats), 2):
+        values = [v for seat in seats[index:index + 2] for v in move_info.get(seat, (0, 0))]
+        if all(v in (-1, 0, 1) for v in values):
+            # four base-3 digits fit in one byte (0..80)
+            code = 0
+            for v in reversed(values):
+                code = code * 3 + int(v) + 1
+            data += bytes((code,))
+        elif all(isinstance(v, int) and -128 <= v <= 127 for v in values):
+            data += bytes((EXTENDED_TICK,)) + EXTENDED_FORMAT.pack(*values)
+        else:
+            data += bytes((FLOAT_TICK,)) + FLOAT_FORMAT.pack(*values)
+    return data
+
+
+def decode_moves(data, offset, seats=PLAYERS):
+    move_info = {}
+    for index in range(0, len(seats), 2):
+        code = data[offset]
+        if code == EXTENDED_TICK:
+            values = list(EXTENDED_FORMAT.unpack_from(data, offset + 1))
+            offset += 1 + EXTENDED_FORMAT.size
+        elif code == FLOAT_TICK:
+            values = list(FLOAT_FORMAT.unpack_from(data, offset + 1))
+            offset += 1 + FLOAT_FORMAT.size
+        else:
+            values = []
+            for _ in range(4):
+                values.append(code % 3 - 1)
+                code //= 3
+            offset += 1
+        move_info[seats[index]] = values[0:2]
+        move_info[seats[index + 1]] = values[2:4]
+    return move_info, offset
+
+
+class MatchRecorder:
+    def __init__(self, game, checkpoint_interval=600):
+        self.checkpoint_interval = checkpoint_interval
+        self.initial_state = game.get_state()
+        self.seats = game.seat_names
+        self.inputs = bytearray()
+        self.checkpoints = []
+        # lag-compensated hits happen outside game_step, so the log keeps them to replay them
+        self.hits = []
+        self.tick = 0
+
+    def record(self, move_info):
+        self.inputs += encode_moves(move_info, self.seats)
+
+    def record_hit(self, seat, ball_index):
+        # called between game_step and after_step, the hit belongs to the tick being finished
+        self.hits.append([self.tick + 1, seat, ball_index])
+
+    def after_step(self, game):
+        self.tick += 1
+        if self.tick % self.checkpoint_interval == 0:
+            # remember where the tick starts in the input log so seeking can jump straight to it
+            self.checkpoints.append({"tick": self.tick, "offset": len(self.inputs), "state": game.get_state()})
+
+    def step(self, game, move_info):
+        self.record(move_info)
+        updates = game.game_step(move_info)
+        self.after_step(game)
+        return updates
+
+    def to_bytes(self):
+        header = json.dumps({
+            "version": RECORDING_VERSION,
+            "ticks": self.tick,
+            "checkpoint_interval": self.checkpoint_interval,
+            "initial_state": self.initial_state,
+            "checkpoints": self.checkpoints,
+            "hits": self.hits,
+        }).encode()
+        return zlib.compress(struct.pack("<I", len(header)) + header + bytes(self.inputs))
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+
+class MatchReplay:
+    def __init__(self, data):
+        data = zlib.decompress(data)
+        header_size, = struct.unpack_from("<I", data)
+        header = json.loads(data[4:4 + header_size])
+        if header["version"] != RECORDING_VERSION:
+            raise ValueError(f"Unsupported recording version {header['version']}.")
+        self.ticks = header["ticks"]
+        self.initial_state = header["initial_state"]
+        self.checkpoints = header["checkpoints"]
+        self.checkpoint_ticks = [c["tick"] for c in self.checkpoints]
+        self.hits = {}
+        for tick, seat, ball_index in header.get("hits", ()):
+            self.hits.setdefault(tick, []).append((seat, ball_index))
+        self.inputs = data[4 + header_size:]
+        self.game = None
+        self.tick = 0
+        self.offset = 0
+        self.seek(0)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+    def seek(self, tick):
+        tick = max(0, min(tick, self.ticks))
+        index = bisect.bisect_right(self.checkpoint_ticks, tick) - 1
+        checkpoint_tick = self.checkpoint_ticks[index] if index >= 0 else 0
+        # replaying forward from the current tick is cheaper unless a later checkpoint is closer
+        if self.game is None or tick < self.tick or checkpoint_tick > self.tick:
+            if index >= 0:
+                checkpoint = self.checkpoints[index]
+                self.game = Game.from_state(checkpoint["state"])
+                self.tick, self.offset = checkpoint["tick"], checkpoint["offset"]
+            else:
+                self.game = Game.from_state(self.initial_state)
+                self.tick, self.offset = 0, 0
+        self.fast_forward(tick - self.tick)
+        return self.game
+
+    def step(self):
+        if self.tick >= self.ticks:
+            return None
+        move_info, self.offset = decode_moves(self.inputs, self.offset, self.game.seat_names)
+        self.tick += 1
+        updates = self.game.game_step(move_info)
+        for seat, ball_index in self.hits.get(self.tick, ()):
+            self.game.balls[ball_index].hit_by(self.game.seats[seat])
+        return updates
+
+    def fast_forward(self, ticks):
+        for _ in range(ticks):
+            if self.step() is None:
+                break
+        return self.game
+
+    def play(self):
+        while True:
+            updates = self.step()
+            if updates is None:
+                return
+            yield self.tick, updates
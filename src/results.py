@@ -0,0 +1,217 @@
+import argparse
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# matches, match_players and goals are only ever appended to; standings is the running total per player,
+# updated in the same transaction so the leaderboard never has to aggregate over every match
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    room TEXT NOT NULL,
+    started REAL NOT NULL,
+    ended REAL NOT NULL,
+    ticks INTEGER NOT NULL,
+    completed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS match_players (
+    match_id INTEGER NOT NULL REFERENCES matches (id),
+    player TEXT NOT NULL,
+    seat TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    opponent_score INTEGER NOT NULL,
+    outcome INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS match_players_by_player ON match_players (player, match_id DESC);
+CREATE TABLE IF NOT EXISTS goals (
+    match_id INTEGER NOT NULL REFERENCES matches (id),
+    tick INTEGER NOT NULL,
+    side INTEGER NOT NULL,
+    ball INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS goals_by_match ON goals (match_id);
+CREATE TABLE IF NOT EXISTS standings (
+    player TEXT PRIMARY KEY,
+    matches INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    draws INTEGER NOT NULL,
+    losses INTEGER NOT NULL,
+    goals_for INTEGER NOT NULL,
+    goals_against INTEGER NOT NULL,
+    goal_difference INTEGER NOT NULL,
+    last_played REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS standings_by_rank ON standings (wins DESC, goal_difference DESC, player);
+"""
+
+UPDATE_STANDING = """
+INSERT INTO standings VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (player) DO UPDATE SET
+    matches = matches + 1,
+    wins = wins + excluded.wins,
+    draws = draws + excluded.draws,
+    losses = losses + excluded.losses,
+    goals_for = goals_for + excluded.goals_for,
+    goals_against = goals_against + excluded.goals_against,
+    goal_difference = goal_difference + excluded.goal_difference,
+    last_played = excluded.last_played
+"""
+
+STANDING_COLUMNS = ("player", "matches", "wins", "draws", "losses", "goals_for", "goals_against",
+                    "goal_difference", "last_played")
+
+
+def outcome(score, opponent_score):
+    return (score > opponent_score) - (score < opponent_score)
+
+
+class ResultsStore:
+    # One connection per thread: the writer thread owns one, readers open their own. WAL lets readers run
+    # alongside the writer instead of waiting for its transactions.
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # with WAL a commit only has to reach the log, the checkpoint syncs the database itself
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def write(self, results):
+        # one transaction per batch: the fsync is what costs, not the rows
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for result in results:
+                self.insert(cursor, result)
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+
+    def insert(self, cursor, result):
+        cursor.execute("INSERT INTO matches (room, started, ended, ticks, completed) VALUES (?, ?, ?, ?, ?)",
+                       (result["room"], result["started"], result["ended"], result["ticks"],
+                        int(result["completed"])))
+        match_id = cursor.lastrowid
+        scores = result["scores"]
+        players = []
+        for seat, player, side in result["players"]:
+            score, opponent_score = scores[side], scores[1 - side]
+            players.append((match_id, player, seat, score, opponent_score, outcome(score, opponent_score)))
+        cursor.executemany("INSERT INTO match_players VALUES (?, ?, ?, ?, ?, ?)", players)
+        cursor.executemany("INSERT INTO goals VALUES (?, ?, ?, ?)",
+                           [(match_id, tick, side, ball) for tick, side, ball in result["goals"]])
+        if not result["completed"]:
+            # abandoned matches are kept in the history but do not count towards the leaderboard
+            return
+        cursor.executemany(UPDATE_STANDING, [
+            (player, decided == 1, decided == 0, decided == -1, score, opponent_score, score - opponent_score,
+             result["ended"])
+            for _, player, _, score, opponent_score, decided in players
+        ])
+
+    def leaderboard(self, limit=10, offset=0):
+        rows = self.connection.execute(
+            "SELECT * FROM standings ORDER BY wins DESC, goal_difference DESC, player LIMIT ? OFFSET ?",
+            (limit, offset))
+        return [dict(zip(STANDING_COLUMNS, row)) for row in rows]
+
+    def standing(self, player):
+        row = self.connection.execute("SELECT * FROM standings WHERE player = ?", (player,)).fetchone()
+        return dict(zip(STANDING_COLUMNS, row)) if row is not None else None
+
+    def history(self, player, limit=20, before=None):
+        # newest first; pass the last match_id of a page as `before` to get the next one
+        rows = self.connection.execute(
+            "SELECT m.id, m.room, m.started, m.ended, m.ticks, m.completed, p.seat, p.score, p.opponent_score,"
+            " p.outcome FROM match_players p JOIN matches m ON m.id = p.match_id"
+            " WHERE p.player = ? AND p.match_id < ? ORDER BY p.match_id DESC LIMIT ?",
+            (player, before if before is not None else 1 << 62, limit))
+        return [{"match_id": match_id, "room": room, "started": started, "ended": ended, "ticks": ticks,
+                 "completed": bool(completed), "seat": seat, "score": score, "opponent_score": opponent_score,
+                 "outcome": decided}
+                for match_id, room, started, ended, ticks, completed, seat, score, opponent_score, decided in rows]
+
+
+class ResultsWriter:
+    # The tick thread only enqueues; a background thread drains the queue and writes each batch in one
+    # transaction. The queue is bounded and submit() never waits, a full queue drops the result instead.
+    def __init__(self, path, batch_size=256, flush_interval=0.5, max_pending=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(max_pending)
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        # opened here so a bad path fails at startup rather than in the thread
+        ResultsStore(path).close()
+        self.thread = threading.Thread(target=self.run, name="results-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, result):
+        try:
+            self.queue.put_nowait(result)
+        except queue.Full:
+            self.dropped += 1
+
+    def get_pending(self):
+        return self.queue.qsize()
+
+    def run(self):
+        store = ResultsStore(self.path)
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            # keep collecting for a moment so a burst of finished matches shares one commit
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = [result for result in batch if result is not None]
+            if not batch:
+                continue
+            try:
+                store.write(batch)
+                self.written += len(batch)
+            except sqlite3.Error:
+                self.failed += len(batch)
+                logger.exception("Could not store %d match results", len(batch))
+        store.close()
+
+    def close(self):
+        # flushes whatever is queued before returning
+        self.queue.put(None)
+        self.thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the match results database.")
+    parser.add_argument("db")
+    parser.add_argument("--player", help="show this player's standing and recent matches instead")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--offset", type=int, default=0)
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+    if args.player is None:
+        result = store.leaderboard(args.limit, args.offset)
+    else:
+        result = {"standing": store.standing(args.player), "history": store.history(args.player, args.limit)}
+    store.close()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
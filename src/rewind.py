@@ -0,0 +1,67 @@
+import array
+
+
+class StateHistory:
+    # Ring of puck positions for the last `window` ticks in one flat array of doubles, slot = tick % window.
+    # The window shrinks to fit max_bytes, so tables with many pucks keep a shorter history.
+    def __init__(self, pucks, window=12, max_bytes=1 << 16):
+        self.stride = 2 * pucks
+        self.window = max(1, min(window, max_bytes // (8 * self.stride)))
+        self.positions = array.array('d', bytes(8 * self.stride * self.window))
+        self.ticks = [-1] * self.window
+
+    def record(self, tick, balls):
+        slot = tick % self.window
+        base = slot * self.stride
+        positions = self.positions
+        for index, ball in enumerate(balls):
+            positions[base + 2 * index] = ball.x
+            positions[base + 2 * index + 1] = ball.y
+        self.ticks[slot] = tick
+
+    def position_at(self, tick, index):
+        slot = tick % self.window
+        if self.ticks[slot] != tick:
+            return None
+        base = slot * self.stride + 2 * index
+        return self.positions[base], self.positions[base + 1]
+
+
+class LagCompensator:
+    # Favor-the-shooter hit checks for late inputs. An input stamped with the tick a player was looking at
+    # is checked against where the puck was on that tick: if the mallet reaches it there, the hit is
+    # applied now. Pucks that changed course after the stamped tick are left alone, so a late input never
+    # overrides a hit the other side has already seen.
+    def __init__(self, game, window=12, max_bytes=1 << 16):
+        self.history = StateHistory(len(game.balls), window, max_bytes)
+        self.last_hit = [-1] * len(game.balls)
+        self.compensated_hits = 0
+
+    def after_step(self, game, tick, stamps):
+        # stamps: seat -> stamped tick for the inputs applied this tick, or None
+        for index, ball in enumerate(game.balls):
+            if ball.speed[0] == ball.initial_speed[0] and ball.speed[1] == ball.initial_speed[1]:
+                self.last_hit[index] = tick
+        # a goal puts the puck back for the face-off, where it was before the goal is no longer in play
+        for index, _ in game.goals:
+            self.last_hit[index] = tick
+        hits = []
+        for seat, stamp in stamps.items():
+            if stamp is None or not 0 < tick - stamp < self.history.window:
+                continue
+            player = game.seats[seat]
+            for index, ball in enumerate(game.balls):
+                if self.last_hit[index] >= stamp:
+                    continue
+                seen = self.history.position_at(stamp, index)
+                if seen is None:
+                    continue
+                # same contact rule as Ball.check_accident_with_player, against the puck the player saw
+                distance = ((seen[0] - player.x) ** 2 + (seen[1] - player.y) ** 2) ** 0.5
+                if abs(distance - player.radius - ball.radius) < 10:
+                    ball.hit_by(player)
+                    self.last_hit[index] = tick
+                    self.compensated_hits += 1
+                    hits.append((seat, index))
+        self.history.record(tick, game.balls)
+        return hits
@@ -0,0 +1,247 @@
+import logging
+import os
+import re
+import time
+from .bots import DIFFICULTIES, BotController
+from .game_engine import Game
+from .inputs import InputBuffer
+from .clients import ClientsService
+from .replay import MatchRecorder
+from .rewind import LagCompensator
+from .snapshot import SnapshotHistory
+from .spectators import SpectatorFeed
+
+logger = logging.getLogger(__name__)
+
+
+class Room:
+    def __init__(self, room_id, max_players=None, game_options=None, recordings_dir=None, spectator_options=None,
+                 lag_options=None, results=None):
+        self.room_id = room_id
+        self.game = Game(**(game_options or {}))
+        # one player per mallet unless the room is sized explicitly
+        self.max_players = max_players or len(self.game.players)
+        self.recordings_dir = recordings_dir
+        self.recorder = MatchRecorder(self.game) if recordings_dir else None
+        self.clientService: ClientsService = ClientsService()
+        self.snapshots = SnapshotHistory()
+        self.spectators = SpectatorFeed(**(spectator_options or {}))
+        self.inputs = {seat: InputBuffer() for seat in self.game.seat_names}
+        self.moves_info = {seat: [0, 0] for seat in self.game.seat_names}
+        self.input_seq = {seat: 0 for seat in self.game.seat_names}
+        # tick each seat's current input was stamped with, for lag compensation
+        self.stamps = {seat: None for seat in self.game.seat_names}
+        self.lag = LagCompensator(self.game, **lag_options) if lag_options is not None else None
+        self.bots = {}
+        # leaderboard names by seat, None for guests who did not give one
+        self.names = {seat: None for seat in self.game.seat_names}
+        # rooms that only exist to run bot matches stay open without anyone connected
+        self.persistent = False
+        self.tick = 0
+        self.game_started = False
+        # seats held for dropped players; the match is paused while there are any
+        self.held_seats = 0
+        # finished matches go to the results writer, which persists them off the tick thread
+        self.results = results
+        self.match_started = time.time()
+        self.match_tick = 0
+        self.match_goals = []
+
+    def is_full(self):
+        return self.clientService.get_count() + len(self.bots) >= self.max_players
+
+    def is_empty(self):
+        return self.clientService.get_count() == 0 and self.spectators.get_count() == 0 and not self.persistent
+
+    def fit_options(self, options):
+        # binary frames only describe player1, player2 and the first puck, so on bigger tables a client that
+        # asked for them gets JSON instead of frames that leave out its own mallet
+        if options and options.get('codec') == 'binary' and (len(self.game.players) > 2 or len(self.game.balls) > 1):
+            return dict(options, codec='json')
+        return options
+
+    def add_client(self, client, options=None):
+        options = self.fit_options(options)
+        if options and options.get('role') == 'spectator':
+            return self.spectators.add(client, options)
+        if self.is_full():
+            return False
+        self.clientService.add_client(client, options)
+        index = self.clientService.get_index(client)
+        # rooms sized past the table (benchmarks) have clients without a mallet
+        if index < len(self.game.players):
+            name = options.get('name') if options else None
+            self.game.players[index].name = name or f"Player{index + 1}"
+            self.names[self.game.seat_names[index]] = name
+        difficulty = options.get('bot') if options else None
+        if difficulty in DIFFICULTIES and self.clientService.get_count() == 1:
+            # a single player asked for opponents: bots take every other seat and the match starts now
+            human = f'player{self.clientService.get_index(client) + 1}'
+            for seat in self.game.seat_names:
+                if seat != human:
+                    self.add_bot(seat, difficulty)
+        self.update_started()
+        return True
+
+    def add_bot(self, seat, difficulty="medium"):
+        self.bots[seat] = BotController(seat, difficulty)
+        self.names[seat] = f"bot:{difficulty}"
+        self.update_started()
+
+    def update_started(self):
+        if self.clientService.get_count() + len(self.bots) == self.max_players and not self.game_started:
+            self.game_started = True
+            self.match_started = time.time()
+
+    def remove_client(self, client):
+        c = self.clientService.get_client(client)
+        if c is not None and not c.connected:
+            self.held_seats -= 1
+        self.clientService.remove_client(client)
+        self.spectators.remove(client)
+
+    def suspend_client(self, client):
+        c = self.clientService.get_client(client)
+        if c is not None and c.connected:
+            c.connected = False
+            self.held_seats += 1
+
+    def resume_client(self, client, new_client, options=None):
+        c = self.clientService.get_client(client)
+        if c is not None and not c.connected:
+            self.held_seats -= 1
+        return self.clientService.replace_client(client, new_client, self.fit_options(options))
+
+    def set_move(self, client, move, seq=None, stamp=None):
+        player_index = self.clientService.get_index(client)
+        buffer = self.inputs.get(f'player{player_index + 1}') if player_index is not None else None
+        if buffer is None:
+            return
+        buffer.push(move, seq, stamp)
+
+    def get_moves(self):
+        for player, buffer in self.inputs.items():
+            bot = self.bots.get(player)
+            if bot is not None:
+                self.moves_info[player] = bot(self.game)
+                continue
+            move, seq, self.stamps[player] = buffer.pop(self.tick)
+            self.moves_info[player] = move
+            # the move handed out now is applied this tick, so its sequence number counts as processed
+            if seq is not None:
+                self.input_seq[player] = seq
+        self.tick += 1
+        return self.moves_info
+
+    def get_game_status(self):
+        return self.game_started and not self.held_seats
+
+    def get_updates(self):
+        updates = self.game.get_updates()
+        updates['input_seq'] = self.input_seq
+        updates['tick'] = self.tick
+        return updates
+
+    def step(self):
+        moves = self.get_moves()
+        updates = self.game.game_step(moves)
+        hits = self.lag.after_step(self.game, self.tick, self.stamps) if self.lag is not None else ()
+        if self.recorder is not None:
+            self.record(moves, hits)
+        if self.game.goals:
+            self.match_goals.extend((self.tick, side, ball_index) for ball_index, side in self.game.goals)
+            if self.game.final_scores is not None:
+                self.finish_match(self.game.final_scores, completed=True)
+        return updates
+
+    def record(self, moves, hits):
+        try:
+            self.recorder.record(moves)
+            for seat, ball_index in hits:
+                self.recorder.record_hit(seat, ball_index)
+            self.recorder.after_step(self.game)
+        except Exception:
+            # a recording with a tick missing would replay wrong from there on, so stop it; the match goes on
+            logger.exception("Recording for room %s failed, it is dropped", self.room_id)
+            self.recorder = None
+
+    def finish_match(self, scores, completed):
+        if self.results is not None:
+            seats = self.game.seat_names
+            self.results.submit({
+                "room": self.room_id,
+                "started": self.match_started,
+                "ended": time.time(),
+                "ticks": self.tick - self.match_tick,
+                "completed": completed,
+                "scores": scores,
+                # odd seats are side 0
+                "players": [(seat, self.names[seat], index % 2) for index, seat in enumerate(seats)
+                            if self.names[seat] is not None],
+                "goals": self.match_goals,
+            })
+        self.match_started = time.time()
+        self.match_tick = self.tick
+        self.match_goals = []
+
+    def close(self):
+        if self.match_goals:
+            # a match left unfinished is kept in the history, not on the leaderboard
+            self.finish_match((self.game.player1.score, self.game.player2.score), completed=False)
+        if self.recorder is None or self.recorder.tick == 0:
+            return
+        name = re.sub(r"[^\w-]", "_", self.room_id)
+        self.recorder.save(os.path.join(self.recordings_dir, f"{name}-{int(time.time())}.rec"))
+
+
+class RoomRegistry:
+    def __init__(self, max_rooms=1000, game_options=None, recordings_dir=None, spectator_options=None,
+                 lag_options=None, results=None):
+        self.max_rooms = max_rooms
+        self.game_options = game_options or {}
+        self.recordings_dir = recordings_dir
+        self.spectator_options = spectator_options or {}
+        self.lag_options = lag_options
+        self.results = results
+        self.rooms = {}
+
+    def get(self, room_id):
+        return self.rooms.get(room_id)
+
+    def join(self, room_id, client, options=None):
+        room = self.rooms.get(room_id)
+        if room is None:
+            if len(self.rooms) >= self.max_rooms:
+                return None
+            room = Room(room_id, game_options=self.game_options, recordings_dir=self.recordings_dir,
+                        spectator_options=self.spectator_options, lag_options=self.lag_options,
+                        results=self.results)
+            self.rooms[room_id] = room
+        if not room.add_client(client, options):
+            return None
+        return room
+
+    def leave(self, room, client):
+        room.remove_client(client)
+        if room.is_empty() and self.rooms.get(room.room_id) is room:
+            del self.rooms[room.room_id]
+            room.close()
+
+    def add_bot_match(self, room_id, difficulty1="medium", difficulty2="medium"):
+        # a room played by two bots, for load testing the tick and broadcast paths without clients
+        if room_id in self.rooms or len(self.rooms) >= self.max_rooms:
+            return None
+        room = Room(room_id, game_options=self.game_options, recordings_dir=self.recordings_dir,
+                    spectator_options=self.spectator_options, lag_options=self.lag_options, results=self.results)
+        room.persistent = True
+        # odd seats play on one side and even seats on the other
+        for index, seat in enumerate(room.game.seat_names):
+            room.add_bot(seat, difficulty2 if index % 2 else difficulty1)
+        self.rooms[room_id] = room
+        return room
+
+    def active_rooms(self):
+        return [room for room in self.rooms.values() if room.get_game_status()]
+
+    def get_count(self):
+        return len(self.rooms)
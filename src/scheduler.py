@@ -0,0 +1,93 @@
+import time
+
+
+class TickStats:
+    def __init__(self):
+        self.ticks = 0
+        self.broadcasts = 0
+        self.overruns = 0
+        self.skipped_ticks = 0
+        self.max_overrun = 0.0
+        self.jitter = 0.0
+        self.max_jitter = 0.0
+
+    def record_jitter(self, lateness):
+        # exponential moving average, same smoothing RFC 3550 uses for interarrival jitter
+        self.jitter += (abs(lateness) - self.jitter) / 16
+        self.max_jitter = max(self.max_jitter, abs(lateness))
+
+    def record_tick(self, duration, interval):
+        self.ticks += 1
+        if duration > interval:
+            self.overruns += 1
+            self.max_overrun = max(self.max_overrun, duration - interval)
+
+    def get_info(self):
+        return {
+            "ticks": self.ticks,
+            "broadcasts": self.broadcasts,
+            "overruns": self.overruns,
+            "skipped_ticks": self.skipped_ticks,
+            "max_overrun_ms": self.max_overrun * 1000,
+            "jitter_ms": self.jitter * 1000,
+            "max_jitter_ms": self.max_jitter * 1000,
+        }
+
+
+class TickScheduler:
+    def __init__(self, tick_rate=100, broadcast_rate=60, max_substeps=4, clock=time.perf_counter, sleep=time.sleep):
+        if tick_rate <= 0 or broadcast_rate <= 0:
+            raise ValueError("Tick and broadcast rates must be positive.")
+        self.tick_interval = 1 / tick_rate
+        self.broadcast_interval = 1 / broadcast_rate
+        self.max_substeps = max_substeps
+        self.clock = clock
+        self.sleep = sleep
+        self.stats = TickStats()
+        self.running = False
+        self.next_tick = None
+        self.next_broadcast = None
+
+    def start(self):
+        now = self.clock()
+        self.next_tick = now
+        self.next_broadcast = now
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def time_until_next(self):
+        return max(0.0, min(self.next_tick, self.next_broadcast) - self.clock())
+
+    def run_pending(self, step, broadcast):
+        now = self.clock()
+        if now < self.next_tick and now < self.next_broadcast:
+            return
+
+        if now >= self.next_tick:
+            self.stats.record_jitter(now - self.next_tick)
+            substeps = 0
+            while self.next_tick <= now and substeps < self.max_substeps:
+                started = self.clock()
+                step()
+                self.stats.record_tick(self.clock() - started, self.tick_interval)
+                self.next_tick += self.tick_interval
+                substeps += 1
+            if self.next_tick <= now:
+                behind = int((now - self.next_tick) / self.tick_interval) + 1
+                self.stats.skipped_ticks += behind
+                self.next_tick += behind * self.tick_interval
+
+        if now >= self.next_broadcast:
+            broadcast()
+            self.stats.broadcasts += 1
+            self.next_broadcast += self.broadcast_interval
+            if self.next_broadcast <= now:
+                self.next_broadcast = now + self.broadcast_interval
+
+    def run(self, step, broadcast):
+        self.start()
+        while self.running:
+            self.run_pending(step, broadcast)
+            self.sleep(self.time_until_next())
@@ -1,33 +1,185 @@
-import threading
+import argparse
+import asyncio
+import logging
 import time
-from game_engine import Game, Player
-from network import Network
+from .bots import DIFFICULTIES
+from .metrics import DEPTH_BUCKETS, Metrics, MetricsServer, SamplingProfiler
+from .network import Network
+from .rooms import RoomRegistry
+from .scheduler import TickScheduler
+
+logger = logging.getLogger(__name__)
 
 
 class Server:
-    def __init__(self, host='0.0.0.0', port=8080):
-        self.network = Network(host=host, port=port)
-        self.clients = []
-        self.game = Game()
+    def __init__(self, host='0.0.0.0', port=8080, max_rooms=1000, tick_rate=100, broadcast_rate=60,
+                 stats_interval=10, continuous_collision=False, recordings_dir=None, spectator_rate=20,
+                 spectator_delay=0.0, max_spectators=5000, metrics_host='127.0.0.1', metrics_port=9100,
+                 profile_every=0, owns_room=None, bot_matches=0, bot_difficulty='medium',
+                 mallets_per_side=1, pucks=1, lag_window=12, lag_memory=1 << 16, goals_to_win=7, results_db=None,
+                 reconnect_grace=10.0):
+        self.results = None
+        if results_db:
+            # sqlite3 is only loaded by servers that store results
+            from .results import ResultsWriter
+            self.results = ResultsWriter(results_db)
+        self.rooms = RoomRegistry(max_rooms=max_rooms,
+                                  game_options={'continuous_collision': continuous_collision,
+                                                'mallets_per_side': mallets_per_side, 'pucks': pucks,
+                                                'goals_to_win': goals_to_win, 'tick_rate': tick_rate},
+                                  recordings_dir=recordings_dir,
+                                  spectator_options={'max_rate': spectator_rate, 'delay': spectator_delay,
+                                                     'max_spectators': max_spectators},
+                                  # rewound hits use the discrete contact rule, so they stay off with swept collision
+                                  lag_options={'window': lag_window, 'max_bytes': lag_memory}
+                                  if lag_window and not continuous_collision else None,
+                                  results=self.results)
+        self.metrics = Metrics()
+        self.profiler = SamplingProfiler(profile_every)
+        self.network = Network(self.rooms, host=host, port=port, metrics=self.metrics, owns_room=owns_room,
+                               grace_period=reconnect_grace)
+        self.metrics_server = None
+        if metrics_port is not None:
+            self.metrics_server = MetricsServer(self.metrics, self.profiler, host=metrics_host, port=metrics_port)
+        self.tick_time = self.metrics.histogram('tick_seconds', help_text="Time spent stepping every active room")
+        self.physics_time = self.metrics.histogram('physics_seconds', help_text="Time spent stepping one room")
+        self.broadcast_time = self.metrics.histogram(
+            'broadcast_seconds', help_text="Time spent broadcasting every active room")
+        self.input_depth = self.metrics.histogram(
+            'input_queue_depth', DEPTH_BUCKETS, help_text="Queued inputs per player when a tick starts")
+        self.register_gauges()
+        for index in range(bot_matches):
+            self.rooms.add_bot_match(f"bots-{index}", bot_difficulty, bot_difficulty)
+        self.scheduler = TickScheduler(tick_rate=tick_rate, broadcast_rate=broadcast_rate)
+        self.spectator_rate = spectator_rate
+        self.stats_interval = stats_interval
+        self.last_stats_report = time.perf_counter()
+
+    def register_gauges(self):
+        transport = self.network.server
+        rooms = self.rooms.rooms
+        self.metrics.gauge('rooms', lambda: len(rooms), "Open rooms")
+        self.metrics.gauge('connections', lambda: transport.connections, "Open websocket connections")
+        self.metrics.gauge('room_players', lambda: {room_id: room.clientService.get_count()
+                                                    for room_id, room in rooms.items()},
+                           "Players connected per room", label='room')
+        self.metrics.gauge('room_spectators', lambda: {room_id: room.spectators.get_count()
+                                                       for room_id, room in rooms.items()},
+                           "Spectators connected per room", label='room')
+        self.metrics.gauge('frames_sent_total', lambda: transport.frames_sent, "Websocket frames queued for sending",
+                           kind='counter')
+        self.metrics.gauge('frames_dropped_total', lambda: transport.frames_dropped,
+                           "Frames shed by slow clients' send queues", kind='counter')
+        self.metrics.gauge('bytes_sent_total', lambda: transport.bytes_sent, "Websocket bytes queued for sending",
+                           kind='counter')
+        self.metrics.gauge('tick_overruns_total', lambda: self.scheduler.stats.overruns,
+                           "Ticks that took longer than the tick interval", kind='counter')
+        network = self.network
+        self.metrics.gauge('held_seats', lambda: len(network.suspended), "Seats held for dropped players")
+        results = self.results
+        if results is not None:
+            self.metrics.gauge('results_pending', results.get_pending, "Match results waiting to be written")
+            self.metrics.gauge('results_written_total', lambda: results.written, "Match results stored",
+                               kind='counter')
+            self.metrics.gauge('results_dropped_total', lambda: results.dropped + results.failed,
+                               "Match results lost to a full queue or a failed write", kind='counter')
+
+    def step_rooms(self):
+        started = time.perf_counter()
+        for room in self.rooms.active_rooms():
+            for buffer in room.inputs.values():
+                self.input_depth.observe(buffer.get_depth())
+            room_started = time.perf_counter()
+            self.profiler.call(room.step)
+            self.physics_time.observe(time.perf_counter() - room_started)
+        self.tick_time.observe(time.perf_counter() - started)
+
+    def broadcast_rooms(self):
+        now = time.perf_counter()
+        for room in self.rooms.active_rooms():
+            seq = self.network.send_to_room(room, room.get_updates())
+            room.spectators.publish(seq, room.snapshots.latest(), now)
+        self.broadcast_time.observe(time.perf_counter() - now)
+        self.network.expire_sessions(time.monotonic())
+        self.report_stats()
 
-        self.game_started = False
+    def report_stats(self):
+        now = time.perf_counter()
+        if now - self.last_stats_report < self.stats_interval:
+            return
+        self.last_stats_report = now
+        logger.info("Tick stats: %s", self.scheduler.stats.get_info())
 
-    def game_loop(self):
-        while True:
-            if self.network.get_game_status():
-                moves_info = self.network.get_moves()
-                self.game.game_step(moves_info)
-                self.network.send_to_all(self.game.get_updates())
-            time.sleep(0.01)
+    async def game_loop(self):
+        if not self.scheduler.running:
+            self.scheduler.start()
+        while self.scheduler.running:
+            self.scheduler.run_pending(self.step_rooms, self.broadcast_rooms)
+            await asyncio.sleep(self.scheduler.time_until_next())
+
+    async def spectator_loop(self):
+        # spectator fan-out runs on its own cadence, outside the scheduler's tick callbacks
+        interval = 1 / self.spectator_rate
+        while self.scheduler.running:
+            started = time.perf_counter()
+            for room in list(self.rooms.rooms.values()):
+                if room.spectators.flush(time.perf_counter(), self.network.server):
+                    await asyncio.sleep(0)
+            await asyncio.sleep(max(0.0, interval - (time.perf_counter() - started)))
+
+    async def serve(self, listen=True):
+        await self.network.start_server(listen)
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        self.scheduler.start()
+        spectators = asyncio.create_task(self.spectator_loop())
+        try:
+            await self.game_loop()
+        finally:
+            spectators.cancel()
+            if self.metrics_server is not None:
+                await self.metrics_server.stop()
+            # saves each room's recording and records its unfinished match
+            for room in list(self.rooms.rooms.values()):
+                room.close()
+            if self.results is not None:
+                # off the loop: close() waits for the writer to flush what is queued
+                await asyncio.to_thread(self.results.close)
 
     def start_server(self):
-        loop_thread = threading.Thread(target=self.network.start_server, daemon=True)
-        loop_thread.start()
-        self.game_loop()
+        asyncio.run(self.serve())
 
 
 def main():
-    ws_server = Server()
+    parser = argparse.ArgumentParser(description="Run the air hockey game server.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--log-level", default="WARNING", help="DEBUG logs every connection and seat change")
+    parser.add_argument("--metrics-port", type=int, default=9100, help="local HTTP metrics port, -1 to disable")
+    parser.add_argument("--profile-every", type=int, default=0, help="profile every Nth room step, 0 disables")
+    parser.add_argument("--tick-rate", type=float, default=100,
+                        help="physics ticks per second; speeds are rescaled so every rate plays the same game")
+    parser.add_argument("--broadcast-rate", type=float, default=60, help="state broadcasts per second")
+    parser.add_argument("--bot-matches", type=int, default=0, help="bot-vs-bot rooms to run for load testing")
+    parser.add_argument("--bot-difficulty", default="medium", choices=sorted(DIFFICULTIES))
+    parser.add_argument("--mallets-per-side", type=int, default=1, help="2 for 2v2 tables")
+    parser.add_argument("--pucks", type=int, default=1)
+    parser.add_argument("--lag-window", type=int, default=12,
+                        help="ticks a late hit may be rewound to check it, 0 disables lag compensation")
+    parser.add_argument("--goals-to-win", type=int, default=7, help="0 plays on without ever ending a match")
+    parser.add_argument("--results-db", help="SQLite file to store finished matches in")
+    parser.add_argument("--recordings-dir", help="directory to write a replayable recording of every room to")
+    parser.add_argument("--reconnect-grace", type=float, default=10.0,
+                        help="seconds a dropped player's seat is held, 0 frees it at once")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    ws_server = Server(port=args.port, tick_rate=args.tick_rate, broadcast_rate=args.broadcast_rate,
+                       metrics_port=None if args.metrics_port < 0 else args.metrics_port,
+                       profile_every=args.profile_every, bot_matches=args.bot_matches,
+                       bot_difficulty=args.bot_difficulty, mallets_per_side=args.mallets_per_side,
+                       pucks=args.pucks, lag_window=args.lag_window, goals_to_win=args.goals_to_win,
+                       results_db=args.results_db, reconnect_grace=args.reconnect_grace,
+                       recordings_dir=args.recordings_dir)
     ws_server.start_server()
 
 
@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import time
+import zlib
+from urllib.parse import parse_qs, urlsplit
+from .network import DEFAULT_ROOM
+from .server import Server
+
+logger = logging.getLogger(__name__)
+
+MAX_HANDSHAKE = 1 << 14
+
+
+def shard_for(room_id, workers):
+    # crc32 rather than hash(): string hashes are salted per process
+    return zlib.crc32(room_id.encode()) % workers
+
+
+def room_from_request(request):
+    try:
+        target = request.split(b"\r\n", 1)[0].split(b" ")[1].decode("latin-1")
+    except IndexError:
+        return DEFAULT_ROOM
+    return parse_qs(urlsplit(target).query).get('room', [DEFAULT_ROOM])[0]
+
+
+def run_worker(index, workers, channel, heartbeat, server_options, log_level):
+    logging.basicConfig(level=log_level, format=f"%(asctime)s %(levelname)s worker{index} %(name)s: %(message)s")
+    server = Server(owns_room=lambda room_id: shard_for(room_id, workers) == index, **server_options)
+    asyncio.run(serve_worker(server, channel, heartbeat))
+
+
+async def serve_worker(server, channel, heartbeat):
+    loop = asyncio.get_running_loop()
+    transport = server.network.server
+    connections = set()
+    channel.setblocking(False)
+
+    def receive():
+        # the acceptor sends one packet per connection: the bytes it read plus the socket itself
+        while True:
+            try:
+                data, fds, _, _ = socket.recv_fds(channel, MAX_HANDSHAKE, 1)
+            except BlockingIOError:
+                return
+            except OSError:
+                fds = []
+            if not fds:
+                # the supervisor went away, stop serving instead of running orphaned
+                loop.remove_reader(channel.fileno())
+                server.scheduler.stop()
+                return
+            task = loop.create_task(transport.adopt(socket.socket(fileno=fds[0]), data))
+            connections.add(task)
+            task.add_done_callback(connections.discard)
+
+    async def beat():
+        while True:
+            heartbeat.value = time.monotonic()
+            await asyncio.sleep(.5)
+
+    loop.add_reader(channel.fileno(), receive)
+    beating = asyncio.create_task(beat())
+    try:
+        await server.serve(listen=False)
+    finally:
+        beating.cancel()
+
+
+class Worker:
+    def __init__(self, index, workers, server_options, log_level):
+        self.index = index
+        self.workers = workers
+        self.server_options = server_options
+        self.log_level = log_level
+        # spawn rather than fork: restarts happen from inside the supervisor's running event loop, and a
+        # forked child would inherit that loop and every other worker's sockets
+        self.context = multiprocessing.get_context("spawn")
+        self.heartbeat = self.context.Value('d', 0.0, lock=False)
+        self.process = None
+        self.channel = None
+        self.restarts = 0
+
+    def start(self):
+        self.channel, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.heartbeat.value = time.monotonic()
+        self.process = self.context.Process(
+            target=run_worker, name=f"worker{self.index}", daemon=True,
+            args=(self.index, self.workers, child, self.heartbeat, self.server_options, self.log_level))
+        self.process.start()
+        child.close()
+        self.channel.setblocking(False)
+
+    def stop(self):
+        if self.process is not None and self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        if self.channel is not None:
+            self.channel.close()
+
+    def is_healthy(self, timeout):
+        return self.process.is_alive() and time.monotonic() - self.heartbeat.value < timeout
+
+    def hand_off(self, sock, data):
+        try:
+            socket.send_fds(self.channel, [data], [sock.fileno()])
+            return True
+        except OSError:
+            # worker is gone or its channel is full; the client retries against a fresh worker
+            return False
+
+
+class Supervisor:
+    # One public port: the supervisor accepts, reads the handshake to learn the room, and passes the socket
+    # to the worker that owns that room. SO_REUSEPORT would spread connections by address, not by room.
+    def __init__(self, host='0.0.0.0', port=8080, workers=None, health_interval=1.0, health_timeout=5.0,
+                 log_level="WARNING", **server_options):
+        self.host = host
+        self.port = port
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        # workers only serve handed-off connections; give each its own metrics port next to the base one
+        metrics_port = server_options.pop('metrics_port', 9100)
+        self.workers = []
+        count = workers or os.cpu_count() or 1
+        for index in range(count):
+            options = dict(server_options, metrics_port=None if metrics_port is None else metrics_port + index)
+            self.workers.append(Worker(index, count, options, log_level))
+        self.listener = None
+        self.running = False
+
+    async def accept(self, sock):
+        loop = asyncio.get_running_loop()
+        data = b""
+        try:
+            while b"\r\n\r\n" not in data:
+                chunk = await asyncio.wait_for(loop.sock_recv(sock, 4096), timeout=5)
+                if not chunk or len(data) + len(chunk) > MAX_HANDSHAKE:
+                    return
+                data += chunk
+            room_id = room_from_request(data)
+            worker = self.workers[shard_for(room_id, len(self.workers))]
+            if not worker.hand_off(sock, data):
+                logger.warning("Could not hand connection for room %s to worker %d", room_id, worker.index)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            # the worker holds its own copy of the socket now
+            sock.close()
+
+    async def accept_loop(self):
+        loop = asyncio.get_running_loop()
+        pending = set()
+        while self.running:
+            sock, _ = await loop.sock_accept(self.listener)
+            sock.setblocking(False)
+            task = loop.create_task(self.accept(sock))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+    async def health_loop(self):
+        while self.running:
+            await asyncio.sleep(self.health_interval)
+            for worker in self.workers:
+                if worker.is_healthy(self.health_timeout):
+                    continue
+                logger.warning("Worker %d is %s, restarting it", worker.index,
+                               "unresponsive" if worker.process.is_alive() else "down")
+                worker.stop()
+                worker.restarts += 1
+                worker.start()
+
+    async def serve(self):
+        self.listener = socket.create_server((self.host, self.port), backlog=1024)
+        self.listener.setblocking(False)
+        self.port = self.listener.getsockname()[1]
+        for worker in self.workers:
+            worker.start()
+        self.running = True
+        logger.info("Supervisor listening on %s:%s with %d workers", self.host, self.port, len(self.workers))
+        health = asyncio.create_task(self.health_loop())
+        try:
+            await self.accept_loop()
+        finally:
+            self.running = False
+            health.cancel()
+            self.listener.close()
+            for worker in self.workers:
+                worker.stop()
+
+    def start_server(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the game server sharded over several worker processes.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of cores")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--metrics-port", type=int, default=9100,
+                        help="first worker's metrics port, worker N uses port + N; -1 disables")
+    parser.add_argument("--results-db", help="SQLite file all workers store finished matches in")
+    parser.add_argument("--recordings-dir", help="directory every worker writes its room recordings to")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    supervisor = Supervisor(port=args.port, workers=args.workers, log_level=args.log_level.upper(),
+                            metrics_port=None if args.metrics_port < 0 else args.metrics_port,
+                            results_db=args.results_db, recordings_dir=args.recordings_dir)
+    supervisor.start_server()
+
+
+if __name__ == "__main__":
+    main()
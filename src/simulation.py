@@ -0,0 +1,147 @@
+import argparse
+import json
+import multiprocessing
+import random
+import statistics
+import time
+from .game_engine import Game
+
+
+def sign(value):
+    return (value > 0) - (value < 0)
+
+
+class IdlePolicy:
+    def __call__(self, game, player, rng):
+        return [0, 0]
+
+
+class RandomPolicy:
+    def __init__(self, hold_ticks=10):
+        self.hold_ticks = hold_ticks
+        self.move = [0, 0]
+        self.ticks_left = 0
+
+    def __call__(self, game, player, rng):
+        if self.ticks_left <= 0:
+            self.move = [rng.choice((-1, 0, 1)), rng.choice((-1, 0, 1))]
+            self.ticks_left = self.hold_ticks
+        self.ticks_left -= 1
+        return self.move
+
+
+class ChasePolicy:
+    def __init__(self, dead_zone=5):
+        self.dead_zone = dead_zone
+
+    def __call__(self, game, player, rng):
+        dx = game.ball.x - player.x
+        dy = game.ball.y - player.y
+        return [sign(dx) if abs(dx) > self.dead_zone else 0, sign(dy) if abs(dy) > self.dead_zone else 0]
+
+
+POLICIES = {
+    "idle": IdlePolicy,
+    "random": RandomPolicy,
+    "chase": ChasePolicy,
+}
+
+
+def run_match(config):
+    rng = random.Random(config.get("seed"))
+    game = Game()
+    game.ball.friction = config.get("friction", game.ball.friction)
+    initial_speed = config.get("initial_speed")
+    if initial_speed is not None:
+        game.ball.initial_speed = [initial_speed, initial_speed]
+    policy1 = POLICIES[config.get("player1", "chase")]()
+    policy2 = POLICIES[config.get("player2", "random")]()
+
+    hits = [0, 0]
+    wall_bounces = 0
+    ticks_in_half = [0, 0]
+    max_ball_speed = 0
+    half = game.screen_height / 2
+    for _ in range(config.get("ticks", 6000)):
+        direction = list(game.ball.direction)
+        game.game_step({
+            "player1": policy1(game, game.player1, rng),
+            "player2": policy2(game, game.player2, rng),
+        })
+        ball = game.ball
+        if ball.speed == ball.initial_speed:
+            distance1 = (ball.x - game.player1.x) ** 2 + (ball.y - game.player1.y) ** 2
+            distance2 = (ball.x - game.player2.x) ** 2 + (ball.y - game.player2.y) ** 2
+            hits[0 if distance1 <= distance2 else 1] += 1
+        elif ball.direction != direction:
+            wall_bounces += 1
+        ticks_in_half[0 if ball.y < half else 1] += 1
+        max_ball_speed = max(max_ball_speed, abs(ball.speed[0]), abs(ball.speed[1]))
+
+    return {
+        "seed": config.get("seed"),
+        "ticks": config.get("ticks", 6000),
+        "score": [game.player1.score, game.player2.score],
+        "hits": hits,
+        "wall_bounces": wall_bounces,
+        "ticks_in_half": ticks_in_half,
+        "max_ball_speed": max_ball_speed,
+    }
+
+
+def summarize(results, elapsed):
+    ticks = sum(r["ticks"] for r in results)
+    score1 = sum(r["score"][0] for r in results)
+    score2 = sum(r["score"][1] for r in results)
+    return {
+        "matches": len(results),
+        "ticks": ticks,
+        "ticks_per_second": ticks / elapsed if elapsed else None,
+        "wins": [sum(r["score"][0] > r["score"][1] for r in results),
+                 sum(r["score"][1] > r["score"][0] for r in results)],
+        "goals": [score1, score2],
+        "hits_mean": [statistics.fmean(r["hits"][i] for r in results) for i in range(2)],
+        "wall_bounces_mean": statistics.fmean(r["wall_bounces"] for r in results),
+        "player1_half_share": sum(r["ticks_in_half"][0] for r in results) / ticks,
+        "max_ball_speed": max(r["max_ball_speed"] for r in results),
+    }
+
+
+def run_simulation(matches, ticks=6000, processes=None, seed=0, **settings):
+    configs = [dict(settings, ticks=ticks, seed=seed + index) for index in range(matches)]
+    started = time.perf_counter()
+    if processes == 1:
+        results = [run_match(config) for config in configs]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = list(pool.imap_unordered(run_match, configs, chunksize=max(1, matches // 64)))
+    results.sort(key=lambda r: r["seed"])
+    return results, summarize(results, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run headless matches as fast as possible.")
+    parser.add_argument("--matches", type=int, default=100)
+    parser.add_argument("--ticks", type=int, default=6000)
+    parser.add_argument("--processes", type=int, default=None, help="worker processes, defaults to CPU count")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--player1", choices=POLICIES, default="chase")
+    parser.add_argument("--player2", choices=POLICIES, default="random")
+    parser.add_argument("--friction", type=float, default=.99)
+    parser.add_argument("--initial-speed", type=float, default=None)
+    parser.add_argument("--results", help="write per-match results as JSON lines to this file")
+    args = parser.parse_args()
+
+    results, summary = run_simulation(
+        args.matches, ticks=args.ticks, processes=args.processes, seed=args.seed,
+        player1=args.player1, player2=args.player2, friction=args.friction, initial_speed=args.initial_speed,
+    )
+    if args.results:
+        with open(args.results, "w") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import copy
+import json
+from collections import OrderedDict
+
+# decimal places kept for positions and speeds; full-precision floats change on every frame and make up most
+# of a delta
+PRECISION = 2
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return {key: freeze(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, float):
+        return round(value, PRECISION)
+    return value
+
+
+def diff(old, new):
+    changes = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = diff(previous, value)
+            if nested:
+                changes[key] = nested
+        elif value != previous:
+            changes[key] = value
+    return changes
+
+
+def apply_delta(state, changes):
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(state.get(key), dict):
+            apply_delta(state[key], value)
+        else:
+            state[key] = value
+    return state
+
+
+class SnapshotHistory:
+    def __init__(self, history_size=64, keyframe_interval=300):
+        self.history_size = history_size
+        self.keyframe_interval = keyframe_interval
+        self.snapshots = OrderedDict()
+        self.seq = 0
+        self.encoded = {}
+
+    def push(self, updates):
+        self.seq += 1
+        self.snapshots[self.seq] = freeze(updates)
+        while len(self.snapshots) > self.history_size:
+            self.snapshots.popitem(last=False)
+        self.encoded = {}
+        return self.seq
+
+    def latest(self):
+        return self.snapshots.get(self.seq)
+
+    def get_baseline(self, client):
+        if client.keyframe_seq is None or self.seq - client.keyframe_seq >= self.keyframe_interval:
+            return None
+        # websocket delivery is ordered, so the last keyframe is a valid baseline even before it is acked
+        base = max(client.acked_seq or 0, client.keyframe_seq)
+        return base if base in self.snapshots else None
+
+    def message_for(self, client):
+        base = self.get_baseline(client)
+        if base is None:
+            client.keyframe_seq = self.seq
+        if base not in self.encoded:
+            self.encoded[base] = json.dumps(self.build_message(base))
+        return self.encoded[base]
+
+    def build_message(self, base):
+        current = self.snapshots[self.seq]
+        if base is None:
+            return {"type": "keyframe", "seq": self.seq, "state": current}
+        return {"type": "delta", "seq": self.seq, "base": base, "changes": diff(self.snapshots[base], current)}
+
+    def ack(self, client, seq):
+        if isinstance(seq, int) and seq <= self.seq and (client.acked_seq is None or seq > client.acked_seq):
+            client.acked_seq = seq
+
+
+class SnapshotReceiver:
+    def __init__(self, history_size=64):
+        self.history_size = history_size
+        self.states = OrderedDict()
+        self.state = None
+        self.seq = None
+
+    def receive(self, message):
+        if message.get("type") == "keyframe":
+            state = message["state"]
+        elif message.get("type") == "delta":
+            # a delta is relative to its baseline, not to whatever frame arrived last
+            base = self.states.get(message["base"])
+            if base is None:
+                return None
+            state = apply_delta(copy.deepcopy(base), message["changes"])
+        else:
+            return None
+
+        self.seq = message["seq"]
+        self.states[self.seq] = state
+        while len(self.states) > self.history_size:
+            self.states.popitem(last=False)
+        self.state = state
+        return state
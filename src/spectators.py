@@ -0,0 +1,105 @@
+import collections
+import json
+from .codec import get_codec
+
+
+def interpolate(old, new, alpha):
+    # only positions move smoothly, everything else snaps to the newer frame
+    result = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            result[key] = interpolate(previous, value, alpha)
+        elif key == "position" and previous is not None:
+            result[key] = [a + (b - a) * alpha for a, b in zip(previous, value)]
+        else:
+            result[key] = value
+    return result
+
+
+class Spectator:
+    def __init__(self, client, interval, codec='json'):
+        self.client = client
+        self.interval = interval
+        self.codec = get_codec(codec)
+        self.next_due = 0.0
+        self.keyframe_sent = False
+
+
+class SpectatorFeed:
+    def __init__(self, max_rate=20, delay=0.0, max_spectators=5000):
+        self.max_rate = max_rate
+        self.delay = delay
+        self.max_spectators = max_spectators
+        self.spectators = {}
+        self.frames = collections.deque()
+
+    def get_count(self):
+        return len(self.spectators)
+
+    def add(self, client, options=None):
+        options = options or {}
+        if len(self.spectators) >= self.max_spectators:
+            return False
+        try:
+            rate = min(float(options.get('rate', self.max_rate)), self.max_rate)
+        except (TypeError, ValueError):
+            rate = self.max_rate
+        if rate != rate:
+            # NaN would make next_due NaN and the spectator would never be due
+            rate = self.max_rate
+        self.spectators[client['id']] = Spectator(client, 1 / max(rate, 0.1), options.get('codec', 'json'))
+        return True
+
+    def remove(self, client):
+        self.spectators.pop(client['id'], None)
+
+    def publish(self, seq, state, now):
+        # called from the tick: only keeps a reference, all encoding happens in flush
+        if not self.spectators:
+            self.frames.clear()
+            return
+        self.frames.append((now, seq, state))
+        while len(self.frames) > 2 and self.frames[1][0] <= now - self.delay:
+            self.frames.popleft()
+
+    def frame_at(self, target):
+        if not self.frames:
+            return None
+        if self.delay <= 0 or len(self.frames) == 1:
+            return self.frames[-1][1], self.frames[-1][2]
+        older = self.frames[0]
+        for newer in self.frames:
+            if newer[0] > target:
+                if newer is older or newer[0] == older[0]:
+                    return newer[1], newer[2]
+                alpha = (target - older[0]) / (newer[0] - older[0])
+                return older[1], interpolate(older[2], newer[2], alpha)
+            older = newer
+        return older[1], older[2]
+
+    def flush(self, now, transport):
+        due = [s for s in self.spectators.values() if s.next_due <= now]
+        if not due:
+            return 0
+        frame = self.frame_at(now - self.delay)
+        if frame is None:
+            return 0
+        seq, state = frame
+
+        # one encoded frame per codec, shared by every spectator due this flush
+        frames = {}
+        for spectator in due:
+            spectator.next_due = max(spectator.next_due + spectator.interval, now)
+            if spectator.codec.name == 'binary' and not spectator.keyframe_sent:
+                key = 'keyframe'
+                if key not in frames:
+                    frames[key] = transport.prepare(json.dumps({"type": "keyframe", "seq": seq, "state": state}))
+                spectator.keyframe_sent = True
+            else:
+                key = spectator.codec.name
+                if key not in frames:
+                    frames[key] = transport.prepare(spectator.codec.encode_state(state, seq))
+            if not transport.send_frame(spectator.client, frames[key]):
+                spectator.keyframe_sent = False
+        return len(due)
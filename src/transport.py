@@ -0,0 +1,357 @@
+import asyncio
+import base64
+import collections
+import hashlib
+import itertools
+import logging
+import os
+import struct
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_INVALID_DATA = 1007
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_TOO_BIG = 1009
+CLOSE_INTERNAL_ERROR = 1011
+
+
+class ProtocolError(Exception):
+    def __init__(self, message, code=CLOSE_PROTOCOL_ERROR):
+        super().__init__(message)
+        self.code = code
+
+
+def accept_key(key):
+    digest = hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()
+    return base64.b64encode(digest).decode()
+
+
+def apply_mask(payload, mask):
+    if not payload:
+        return payload
+    # xor the whole payload as one big integer instead of byte by byte
+    repeated = (mask * (len(payload) // 4 + 1))[:len(payload)]
+    masked = int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")
+    return masked.to_bytes(len(payload), "big")
+
+
+def encode_frame(payload, opcode=None, mask=False):
+    if isinstance(payload, str):
+        payload = payload.encode()
+        if opcode is None:
+            opcode = OPCODE_TEXT
+    elif opcode is None:
+        opcode = OPCODE_BINARY
+
+    length = len(payload)
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, mask_bit | length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, mask_bit | 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, mask_bit | 127, length)
+
+    if mask:
+        mask_key = os.urandom(4)
+        return header + mask_key + apply_mask(payload, mask_key)
+    return header + payload
+
+
+async def read_frame(reader, max_size, require_mask=True):
+    first, second = await reader.readexactly(2)
+    fin = bool(first & 0x80)
+    opcode = first & 0x0F
+    masked = bool(second & 0x80)
+    length = second & 0x7F
+    if first & 0x70:
+        raise ProtocolError("Reserved bits must be zero.")
+    if require_mask and not masked:
+        raise ProtocolError("Client frames must be masked.")
+
+    if length == 126:
+        length, = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack("!Q", await reader.readexactly(8))
+    if length > max_size:
+        raise ProtocolError("Frame exceeds the maximum message size.", CLOSE_TOO_BIG)
+
+    mask_key = await reader.readexactly(4) if masked else None
+    payload = await reader.readexactly(length)
+    if mask_key is not None:
+        payload = apply_mask(payload, mask_key)
+    return fin, opcode, payload
+
+
+class Connection:
+    def __init__(self, reader, writer, client_id, path, max_message_size, require_mask=True, mask_frames=False,
+                 high_water=1 << 16, max_queue=32, max_dropped=256):
+        self.reader = reader
+        self.writer = writer
+        self.id = client_id
+        self.path = path
+        self.max_message_size = max_message_size
+        self.require_mask = require_mask
+        self.mask_frames = mask_frames
+        self.high_water = high_water
+        self.max_queue = max_queue
+        self.max_dropped = max_dropped
+        self.queue = collections.deque()
+        self.draining = False
+        self.dropped_frames = 0
+        self.total_dropped = 0
+        self.closed = False
+        writer.transport.set_write_buffer_limits(high=high_water)
+
+    async def recv(self):
+        fragments = []
+        message_opcode = None
+        size = 0
+        while True:
+            fin, opcode, payload = await read_frame(self.reader, self.max_message_size, self.require_mask)
+            if opcode == OPCODE_CLOSE:
+                return None
+            if opcode == OPCODE_PING:
+                self.send_frame(encode_frame(payload, OPCODE_PONG, mask=self.mask_frames))
+                continue
+            if opcode == OPCODE_PONG:
+                continue
+            if opcode in (OPCODE_TEXT, OPCODE_BINARY):
+                if message_opcode is not None:
+                    raise ProtocolError("Expected a continuation frame.")
+                message_opcode = opcode
+            elif opcode != OPCODE_CONTINUATION or message_opcode is None:
+                raise ProtocolError(f"Unexpected opcode {opcode}.")
+
+            size += len(payload)
+            if size > self.max_message_size:
+                raise ProtocolError("Message exceeds the maximum message size.", CLOSE_TOO_BIG)
+            fragments.append(payload)
+            if fin:
+                message = b"".join(fragments)
+                if message_opcode == OPCODE_BINARY:
+                    return message
+                try:
+                    return message.decode()
+                except UnicodeDecodeError:
+                    raise ProtocolError("Text message is not valid UTF-8.", CLOSE_INVALID_DATA) from None
+
+    def send_frame(self, frame):
+        if self.closed:
+            return True
+        if not self.draining:
+            self.writer.write(frame)
+            if self.writer.transport.get_write_buffer_size() > self.high_water:
+                self.draining = True
+                asyncio.get_running_loop().create_task(self.drain())
+            return True
+
+        # the socket is backed up: keep only the newest frames and give up on clients that never catch up
+        dropped = len(self.queue) >= self.max_queue
+        if dropped:
+            self.queue.popleft()
+            self.dropped_frames += 1
+            self.total_dropped += 1
+            if self.dropped_frames > self.max_dropped:
+                self.abort()
+                return False
+        self.queue.append(frame)
+        return not dropped
+
+    async def drain(self):
+        try:
+            while not self.closed:
+                await self.writer.drain()
+                while self.queue and self.writer.transport.get_write_buffer_size() <= self.high_water:
+                    self.writer.write(self.queue.popleft())
+                if not self.queue and self.writer.transport.get_write_buffer_size() <= self.high_water:
+                    self.dropped_frames = 0
+                    break
+        except ConnectionError:
+            self.abort()
+        finally:
+            self.draining = False
+
+    def send(self, message):
+        self.send_frame(encode_frame(message, mask=self.mask_frames))
+
+    def close(self, code=CLOSE_NORMAL):
+        if self.closed:
+            return
+        self.queue.clear()
+        self.writer.write(encode_frame(struct.pack("!H", code), OPCODE_CLOSE, mask=self.mask_frames))
+        self.closed = True
+        self.writer.close()
+
+    def abort(self):
+        if self.closed:
+            return
+        self.queue.clear()
+        self.closed = True
+        self.writer.transport.abort()
+
+
+class WebsocketTransport:
+    def __init__(self, host='0.0.0.0', port=8080, max_message_size=1 << 16, backlog=1024, max_queue=32,
+                 max_dropped=256):
+        self.host = host
+        self.port = port
+        self.max_message_size = max_message_size
+        self.backlog = backlog
+        self.max_queue = max_queue
+        self.max_dropped = max_dropped
+        self.server = None
+        self.ids = itertools.count(1)
+        self.connections = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.bytes_sent = 0
+        self.fn_new_client = None
+        self.fn_client_left = None
+        self.fn_message_received = None
+
+    def set_fn_new_client(self, fn):
+        self.fn_new_client = fn
+
+    def set_fn_client_left(self, fn):
+        self.fn_client_left = fn
+
+    def set_fn_message_received(self, fn):
+        self.fn_message_received = fn
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, backlog=self.backlog)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def adopt(self, sock, data=b""):
+        # serve a connection accepted elsewhere (see sharding.py); data is what the acceptor already read
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(loop=loop)
+        reader.feed_data(data)
+        protocol = asyncio.StreamReaderProtocol(reader)
+        transport, _ = await loop.create_connection(lambda: protocol, sock=sock)
+        await self.handle(reader, asyncio.StreamWriter(transport, protocol, reader, loop))
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handshake(self, reader, writer):
+        request = await reader.readuntil(b"\r\n\r\n")
+        lines = request.decode("latin-1").split("\r\n")
+        method, target, _ = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        key = headers.get("sec-websocket-key")
+        if method != "GET" or headers.get("upgrade", "").lower() != "websocket" or not key:
+            writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+            return None
+
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept_key(key)}\r\n\r\n"
+        ).encode())
+        return urlsplit(target)
+
+    async def handle(self, reader, writer):
+        try:
+            target = await self.handshake(reader, writer)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            target = None
+        if target is None:
+            writer.close()
+            return
+
+        connection = Connection(reader, writer, next(self.ids), target.path, self.max_message_size,
+                                max_queue=self.max_queue, max_dropped=self.max_dropped)
+        client = {
+            'id': connection.id,
+            'handler': connection,
+            'address': writer.get_extra_info("peername"),
+            'path': target.path,
+            'query': target.query,
+        }
+        self.connections += 1
+        try:
+            self.fn_new_client(client, self)
+            while not connection.closed:
+                message = await connection.recv()
+                if message is None:
+                    # the peer sent a close frame, it is leaving on purpose
+                    client['closed_cleanly'] = True
+                    break
+                try:
+                    self.fn_message_received(client, self, message)
+                except Exception:
+                    # a bad message costs that message, not the connection
+                    logger.exception("Error handling a message from client %s", client['id'])
+        except ProtocolError as e:
+            connection.close(e.code)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception:
+            logger.exception("Error serving client %s", client['id'])
+            connection.close(CLOSE_INTERNAL_ERROR)
+        finally:
+            connection.close()
+            self.connections -= 1
+            try:
+                self.fn_client_left(client, self)
+            except Exception:
+                logger.exception("Error removing client %s", client['id'])
+
+    def prepare(self, message):
+        return encode_frame(message)
+
+    def send_frame(self, client, frame):
+        self.frames_sent += 1
+        self.bytes_sent += len(frame)
+        if client['handler'].send_frame(frame):
+            return True
+        self.frames_dropped += 1
+        return False
+
+    def send_message(self, client, message):
+        client['handler'].send(message)
+
+    def disconnect_client(self, client):
+        client['handler'].close()
+
+
+async def connect(host, port, path="/", max_message_size=1 << 20):
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write((
+        f"GET {path} HTTP/1.1\r\n"
+        f"Host: {host}:{port}\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\n"
+        "Sec-WebSocket-Version: 13\r\n\r\n"
+    ).encode())
+    response = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+    if not response.startswith("HTTP/1.1 101") or accept_key(key) not in response:
+        writer.close()
+        raise ConnectionError(f"Websocket handshake failed: {response.splitlines()[0] if response else ''}")
+    return Connection(reader, writer, None, path, max_message_size, require_mask=False, mask_frames=True)
@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from src.game_engine import Game
+
+np = pytest.importorskip("numpy")
+from src.batch_engine import BatchGame  # noqa: E402
+
+
+def sign(value):
+    return (value > 0) - (value < 0)
+
+
+def chase_moves(rng, games):
+    # mostly towards the ball, so mallets hit it and goals get scored, with some random moves mixed in
+    moves = []
+    for game in games:
+        pair = []
+        for player in (game.player1, game.player2):
+            if rng.random() < 0.3:
+                pair.append([rng.choice((-1, 0, 1)), rng.choice((-1, 0, 1))])
+            else:
+                pair.append([sign(game.ball.x - player.x), sign(game.ball.y - player.y)])
+        moves.append(pair)
+    return moves
+
+
+def test_batch_matches_scalar_games():
+    rng = random.Random(7)
+    games = [Game(goals_to_win=3) for _ in range(8)]
+    scalar = [Game(goals_to_win=3) for _ in range(8)]
+    batch = BatchGame(games)
+    for _ in range(3000):
+        moves = chase_moves(rng, scalar)
+        batch.game_step(moves)
+        for game, (move1, move2) in zip(scalar, moves):
+            game.game_step({"player1": move1, "player2": move2})
+
+    for index, game in enumerate(scalar):
+        updates = batch.get_updates(index)
+        expected = game.get_updates()
+        for key in ("player1", "player2", "ball"):
+            assert updates[key]["position"] == expected[key]["position"]
+        assert updates["player1"]["score"] == expected["player1"]["score"]
+        assert updates["player2"]["score"] == expected["player2"]["score"]
+        assert updates["ball"]["speed"] == expected["ball"]["speed"]
+
+
+def test_batch_rejects_games_it_cannot_run():
+    with pytest.raises(ValueError):
+        BatchGame([Game(pucks=2)])
+    with pytest.raises(ValueError):
+        BatchGame([Game(continuous_collision=True)])
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from src.codec import BinaryCodec, JsonCodec, get_codec, normalize_move
+from src.game_engine import Game
+
+
+def sample_updates():
+    game = Game()
+    for _ in range(30):
+        game.game_step({"player1": [1, 1], "player2": [-1, 0]})
+    updates = json.loads(json.dumps(game.get_updates()))
+    updates["input_seq"] = {"player1": 12, "player2": 7}
+    return updates
+
+
+def test_binary_state_round_trip():
+    codec = BinaryCodec()
+    updates = sample_updates()
+    frame = codec.encode_state(updates, 42)
+    decoded = codec.decode_state(frame)
+    assert decoded["seq"] == 42
+    for key in ("player1", "player2", "ball"):
+        assert decoded[key]["position"] == pytest.approx(updates[key]["position"], abs=1e-3)
+    assert decoded["player1"]["score"] == updates["player1"]["score"]
+    assert decoded["input_seq"] == updates["input_seq"]
+
+
+@pytest.mark.parametrize("seq, seen_seq", [(None, None), (9, None), (9, 40)])
+def test_binary_input_round_trip(seq, seen_seq):
+    codec = BinaryCodec()
+    message = codec.encode_input(-1, 1, seq, seen_seq)
+    assert codec.decode_input(message) == ([-1, 1], seq)
+    assert codec.decode_stamp(message) == seen_seq
+
+
+def test_binary_input_rejects_other_sizes():
+    with pytest.raises(ValueError):
+        BinaryCodec().decode_input(b"\x01\x00\x00")
+
+
+def test_json_round_trip():
+    codec = JsonCodec()
+    updates = sample_updates()
+    assert json.loads(codec.encode_state(updates, 1)) == updates
+    assert codec.decode_input(codec.encode_input(3, -0.5, seq=4)) == ([1, -1], 4)
+
+
+@pytest.mark.parametrize("message", ['[1, 2]', '{"dx": "1", "dy": 0}', '{"dx": true, "dy": 0}'])
+def test_json_input_rejects_bad_messages(message):
+    with pytest.raises(ValueError):
+        JsonCodec().decode_input(message)
+
+
+def test_normalize_move_and_lookup():
+    assert normalize_move(0, -7) == [0, -1]
+    assert normalize_move(None, 1) is None
+    assert get_codec("binary").name == "binary"
+    assert get_codec("unknown").name == "json"
+
+
+def test_json_input_type_checks_seq_and_tick():
+    codec = JsonCodec()
+    message = {"dx": 1, "dy": 0, "seq": "4", "tick": True}
+    assert codec.decode_input(message) == ([1, 0], None)
+    assert codec.decode_stamp(message) is None
+    assert codec.decode_stamp('{"dx": 0, "dy": 0, "tick": 120}') == 120
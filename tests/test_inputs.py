@@ -0,0 +1,52 @@
+import pytest
+
+from src.inputs import InputBuffer
+
+
+def test_inputs_between_ticks_queue_onto_consecutive_ticks():
+    buffer = InputBuffer()
+    buffer.push([1, 0], seq=1)
+    buffer.push([0, 1], seq=2)
+    assert buffer.get_depth() == 2
+    assert buffer.pop(0)[:2] == ([1, 0], 1)
+    assert buffer.pop(1)[:2] == ([0, 1], 2)
+    assert buffer.get_depth() == 0
+
+
+def test_flooding_merges_into_the_last_queued_slot():
+    buffer = InputBuffer(size=8, max_backlog=4)
+    for seq in range(6):
+        buffer.push([1, 0], seq=seq)
+    assert buffer.get_depth() == 4
+    assert buffer.coalesced == 2
+    popped = [buffer.pop(tick)[1] for tick in range(4)]
+    assert popped == [0, 1, 2, 5]
+
+
+def test_unsequenced_input_is_held_for_a_few_ticks():
+    buffer = InputBuffer(hold_ticks=3)
+    buffer.push([-1, 1])
+    assert buffer.pop(0)[0] == [-1, 1]
+    for tick in range(1, 4):
+        assert buffer.pop(tick)[0] == [-1, 1]
+    assert buffer.pop(4)[0] == [0, 0]
+
+
+def test_sequenced_input_is_applied_once():
+    buffer = InputBuffer()
+    buffer.push([1, 1], seq=5)
+    assert buffer.pop(0)[:2] == ([1, 1], 5)
+    assert buffer.pop(1)[:2] == ([0, 0], None)
+
+
+def test_late_input_goes_to_the_current_tick():
+    buffer = InputBuffer()
+    for tick in range(10):
+        buffer.pop(tick)
+    buffer.push([0, -1], seq=1, stamp=4)
+    assert buffer.pop(10) == ([0, -1], 1, 4)
+
+
+def test_backlog_must_fit_the_ring():
+    with pytest.raises(ValueError):
+        InputBuffer(size=4, max_backlog=4)
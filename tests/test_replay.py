@@ -0,0 +1,46 @@
+import random
+
+from src.game_engine import Game
+from src.replay import MatchRecorder, MatchReplay
+
+
+def record_match(ticks, seed=3, checkpoint_interval=100):
+    rng = random.Random(seed)
+    game = Game(goals_to_win=3)
+    recorder = MatchRecorder(game, checkpoint_interval=checkpoint_interval)
+    states = [game.get_state()]
+    for _ in range(ticks):
+        moves = {seat: [rng.choice((-1, 0, 1)), rng.choice((-1, 0, 1))] for seat in game.seat_names}
+        recorder.step(game, moves)
+        states.append(game.get_state())
+    return recorder, states
+
+
+def test_replay_reproduces_every_tick():
+    recorder, states = record_match(1000)
+    replay = MatchReplay(recorder.to_bytes())
+    assert replay.ticks == 1000
+    for tick, _ in replay.play():
+        assert replay.game.get_state() == states[tick]
+    assert replay.tick == 1000
+
+
+def test_replay_keeps_inputs_outside_the_compact_range():
+    game = Game()
+    recorder = MatchRecorder(game)
+    recorder.step(game, {"player1": [5, -2], "player2": [0, 1]})
+    replay = MatchReplay(recorder.to_bytes())
+    replay.step()
+    assert replay.game.get_state() == game.get_state()
+
+
+def test_seek_matches_replaying_from_the_start(tmp_path):
+    recorder, states = record_match(1000)
+    path = tmp_path / "match.rec"
+    recorder.save(path)
+    replay = MatchReplay.load(path)
+    # forward past a checkpoint, backwards, and to the very end
+    for tick in (250, 730, 99, 100, 0, 1000):
+        assert replay.seek(tick).get_state() == states[tick]
+        assert replay.tick == tick
+    assert replay.seek(5000).get_state() == states[1000]
@@ -0,0 +1,28 @@
+import random
+
+from src.game_engine import Ball, SpatialGrid
+
+
+def test_query_finds_every_body_in_range():
+    rng = random.Random(11)
+    grid = SpatialGrid(cell_size=64)
+    out = []
+    for _ in range(20):
+        bodies = [Ball(rng.uniform(0, 800), rng.uniform(0, 600), [0, 0], 20) for _ in range(40)]
+        grid.rebuild(bodies)
+        for _ in range(50):
+            x, y, radius = rng.uniform(-50, 850), rng.uniform(-50, 650), rng.uniform(5, 120)
+            found = grid.query(x, y, radius, out)
+            expected = [index for index, body in enumerate(bodies)
+                        if abs(body.x - x) <= radius and abs(body.y - y) <= radius]
+            assert set(expected) <= set(found)
+            assert found == sorted(set(found))
+
+
+def test_rebuild_forgets_old_positions():
+    grid = SpatialGrid(cell_size=64)
+    out = []
+    grid.rebuild([Ball(10, 10, [0, 0], 10)])
+    grid.rebuild([Ball(500, 500, [0, 0], 10)])
+    assert grid.query(10, 10, 20, out) == []
+    assert grid.query(500, 500, 20, out) == [0]